@@ -1,7 +1,7 @@
 import os
 import random
-from collections import deque
 import numpy as np
+from agents.replay_memory import ReplayMemory
 from keras.models import Sequential
 from keras.layers import Dense, GRU
 from keras.optimizers import Adam
@@ -41,7 +41,7 @@ class DQNAgent:
     def __init__(self, state_size, action_size, memory_size=200, gamma=0.95, epsilon=1.0, epsilon_decay_rate=0.995, epsilon_min=0.01, learning_rate=0.0002, name='GRU_ReLU_DQNAgent'):
         self.state_size = state_size
         self.action_size = action_size
-        self.memory = deque(maxlen=memory_size)
+        self.memory = ReplayMemory(memory_size)
         self.gamma = gamma
         self.epsilon = epsilon
         self.epsilon_decay_rate = epsilon_decay_rate
@@ -72,7 +72,7 @@ class DQNAgent:
 
     # Save a sample into memory
     def remember(self, state, action, reward, next_state, done):
-        self.memory.append((state, action, reward, next_state, done))
+        self.memory.append(state, action, reward, next_state, done)
 
     # Choose an action
     def act(self, states):
@@ -86,22 +86,15 @@ class DQNAgent:
 
     def replay(self, batch_size):
         # Sample from memory
-        minibatch = random.sample(self.memory, batch_size)
-
-        # Divide minibatch items' properties
-        states = np.asarray([item[0] for item in minibatch])
-        actions = np.asarray([item[1] for item in minibatch])
-        rewards = np.asarray([item[2] for item in minibatch])
-        next_states = np.asarray([item[3] for item in minibatch])
-
-        # Predict the Q-value for each actions of each state
-        currents_q_values = self.model.predict(x=states, batch_size=batch_size)
-        # Predict the Q-value for each actions of each next state
-        next_states_q_values = self.model.predict(x=next_states, batch_size=batch_size)
-
-        # Update the Q-value of the choosen action for each state
-        for current_q_values, action, reward, next_state_q_values in zip(currents_q_values, actions, rewards, next_states_q_values):
-            current_q_values[action] = reward + self.gamma * np.amax(next_state_q_values)
+        states, actions, rewards, next_states, dones = self.memory.sample(batch_size)
+
+        # Predict the Q-value for each actions of each state and of each next state, with a single forward pass over both batches
+        q_values = self.model.predict_on_batch(np.concatenate([states, next_states]))
+        currents_q_values, next_states_q_values = q_values[:len(states)], q_values[len(states):]
+
+        # Update the Q-value of the choosen action for each state: Bellman target, no bootstrap from the last transition of an episode
+        targets = rewards + self.gamma * np.amax(next_states_q_values, axis=1) * (1 - dones)
+        currents_q_values[np.arange(len(actions)), actions] = targets
 
         # Train the model
         self.model.fit(
@@ -1,7 +1,7 @@
 import os
 import random
-from collections import deque
 import numpy as np
+from agents.replay_memory import ReplayMemory
 from keras.models import Sequential, Model
 from keras.layers import Dense, CuDNNLSTM, Dropout, Add, Input, BatchNormalization
 from keras.optimizers import Adam, RMSprop
@@ -42,7 +42,7 @@ class DQNAgent:
     def __init__(self, state_size, action_size, memory_size=200, gamma=0.95, epsilon=1.0, epsilon_decay_rate=0.995, epsilon_min=0.01, learning_rate=0.0002, sample_size=32, batch_size=32, name='CuDNNLSTM_Swish_DQNAgent'):
         self.state_size = state_size
         self.action_size = action_size
-        self.memory = deque(maxlen=memory_size)
+        self.memory = ReplayMemory(memory_size)
         self.gamma = gamma
         self.epsilon = epsilon
         self.epsilon_decay_rate = epsilon_decay_rate
@@ -111,7 +111,7 @@ class DQNAgent:
 
     # Save a sample into memory
     def remember(self, state, action, reward, next_state, done):
-        self.memory.append((state, action, reward, next_state, done))
+        self.memory.append(state, action, reward, next_state, done)
 
     # Choose an action
     def act(self, states):
@@ -129,43 +129,24 @@ class DQNAgent:
 
     def replay(self):
         # Sample from memory
-        minibatch = random.sample(self.memory, self.batch_size)
-
-        # Divide minibatch items' properties
-        states = np.asarray([item[0] for item in minibatch])
-        cells_states = states[:, :, :(self.state_size - 1)]
-        tls_phase_states = states[:, :, [(self.state_size - 1)]]
-        actions = np.asarray([item[1] for item in minibatch])
-        rewards = np.asarray([item[2] for item in minibatch])
-        next_states = np.asarray([item[3] for item in minibatch])
-        cells_next_states = next_states[:, :, :(self.state_size - 1)]
-        tls_phase_next_states = next_states[:, :, [(self.state_size - 1)]]
-
-        # Predict the Q-value for each actions of each state
+        states, actions, rewards, next_states, dones = self.memory.sample(self.batch_size)
+        # Cells and tls phase inputs of the states and of the next states, sliced once for both
+        all_states = np.concatenate([states, next_states])
+        all_cells_states = all_states[:, :, :(self.state_size - 1)]
+        all_tls_phase_states = all_states[:, :, [(self.state_size - 1)]]
+        cells_states = all_cells_states[:len(states)]
+        tls_phase_states = all_tls_phase_states[:len(states)]
+
+        # Predict the Q-value for each actions of each state and of each next state, with a single forward pass over both batches
         # K.set_learning_phase(0)
         # with self.graph.as_default():
-        currents_q_values = self.model.predict(x=[cells_states, tls_phase_states], batch_size=self.batch_size)
-        # Predict the Q-value for each actions of each next state
-        # K.set_learning_phase(0)
-        # with self.graph.as_default():
-        next_states_q_values = self.model.predict(x=[cells_next_states, tls_phase_next_states], batch_size=self.batch_size)
-
-        # Update the Q-value of the choosen action for each state
-        for current_q_values, action, reward, next_state_q_values in zip(currents_q_values, actions, rewards, next_states_q_values):
-            # print(reward)
-            # print(current_q_values[action])
-
-            current_q_values[action] = reward + self.gamma * np.amax(next_state_q_values)
-
-            if current_q_values[action] > 1:
-                current_q_values[action] = 1
-            # elif current_q_values[action] < 0:
-            #     current_q_values[action] = 0
-            elif current_q_values[action] < -1:
-                current_q_values[action] = -1
+        q_values = self.model.predict_on_batch([all_cells_states, all_tls_phase_states])
+        currents_q_values, next_states_q_values = q_values[:len(states)], q_values[len(states):]
 
-            # print(current_q_values[action])
-            # print('- - - - -')
+        # Update the Q-value of the choosen action for each state: Bellman target, no bootstrap from the last transition of an episode,
+        # clipped to [-1, 1]
+        targets = rewards + self.gamma * np.amax(next_states_q_values, axis=1) * (1 - dones)
+        currents_q_values[np.arange(len(actions)), actions] = np.clip(targets, -1, 1)
 
         # import sys
         # sys.exit("Error message")
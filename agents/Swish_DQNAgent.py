@@ -1,7 +1,7 @@
 import os
 import random
-from collections import deque
 import numpy as np
+from agents.replay_memory import ReplayMemory
 from keras.models import Sequential, Model
 from keras.layers import Dense, GRU, Dropout, Input
 from keras.optimizers import Adam
@@ -42,7 +42,7 @@ class DQNAgent:
     def __init__(self, state_size, action_size, memory_size=200, gamma=0.95, epsilon=1.0, epsilon_decay_rate=0.995, epsilon_min=0.01, learning_rate=0.0002, sample_size=32, batch_size=32, name='Swish_DQNAgent'):
         self.state_size = state_size
         self.action_size = action_size
-        self.memory = deque(maxlen=memory_size)
+        self.memory = ReplayMemory(memory_size)
         self.gamma = gamma
         self.epsilon = epsilon
         self.epsilon_decay_rate = epsilon_decay_rate
@@ -81,7 +81,7 @@ class DQNAgent:
 
     # Save a sample into memory
     def remember(self, state, action, reward, next_state, done):
-        self.memory.append((state, action, reward, next_state, done))
+        self.memory.append(state, action, reward, next_state, done)
 
     # Choose an action
     def act(self, state):
@@ -95,27 +95,16 @@ class DQNAgent:
 
     def replay(self):
         # Sample from memory
-        minibatch = random.sample(self.memory, self.batch_size)
-
-        # Divide minibatch items' properties
-        states = np.asarray([item[0] for item in minibatch])
-        actions = np.asarray([item[1] for item in minibatch])
-        rewards = np.asarray([item[2] for item in minibatch])
-        next_states = np.asarray([item[3] for item in minibatch])
-
-        # Predict the Q-value for each actions of each state
-        currents_q_values = self.model.predict(x=states, batch_size=self.batch_size)
-        # Predict the Q-value for each actions of each next state
-        next_states_q_values = self.model.predict(x=next_states, batch_size=self.batch_size)
-
-        # Update the Q-value of the choosen action for each state
-        for current_q_values, action, reward, next_state_q_values in zip(currents_q_values, actions, rewards, next_states_q_values):
-            current_q_values[action] = reward + self.gamma * np.amax(next_state_q_values)
-
-            # if current_q_values[action] > 1:
-            #     current_q_values[action] = 1
-            # elif current_q_values[action] < -1:
-            #     current_q_values[action] = -1
+        states, actions, rewards, next_states, dones = self.memory.sample(self.batch_size)
+
+        # Predict the Q-value for each actions of each state and of each next state, with a single forward pass over both batches
+        q_values = self.model.predict_on_batch(np.concatenate([states, next_states]))
+        currents_q_values, next_states_q_values = q_values[:len(states)], q_values[len(states):]
+
+        # Update the Q-value of the choosen action for each state: Bellman target, no bootstrap from the last transition of an episode
+        targets = rewards + self.gamma * np.amax(next_states_q_values, axis=1) * (1 - dones)
+        # targets = np.clip(targets, -1, 1)
+        currents_q_values[np.arange(len(actions)), actions] = targets
 
         # Train the model
         history = self.model.fit(
@@ -0,0 +1,41 @@
+import random
+import numpy as np
+
+
+class ReplayMemory:
+
+    # Transitions stored in preallocated arrays used as a ring buffer (the oldest one is overwritten once full, as a deque with maxlen):
+    # O(1) insert, and a minibatch is one fancy-index gather per array whatever the memory size.
+    # The arrays are allocated with the first transition, so any state shape fits (a single state or a history of states).
+    def __init__(self, size):
+        self.size = size
+        self.states = None
+        self.actions = np.zeros(size, dtype=np.int64)
+        self.rewards = np.zeros(size)
+        self.next_states = None
+        self.dones = np.zeros(size, dtype=bool)
+        # Slot of the next transition, number of transitions stored
+        self.index = 0
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def append(self, state, action, reward, next_state, done):
+        if self.states is None:
+            self.states = np.zeros((self.size, ) + np.shape(state))
+            self.next_states = np.zeros((self.size, ) + np.shape(next_state))
+        self.states[self.index] = state
+        self.actions[self.index] = action
+        self.rewards[self.index] = reward
+        self.next_states[self.index] = next_state
+        self.dones[self.index] = done
+        self.index = (self.index + 1) % self.size
+        self.length = min(self.length + 1, self.size)
+
+    # Uniform minibatch: states, actions, rewards, next_states, dones.
+    # Drawn without replacement: no transition twice in a minibatch. random.sample on a range costs O(batch_size), not
+    # O(memory size) as np.random.choice(..., replace=False), which permutes every index on each call.
+    def sample(self, batch_size):
+        indexes = np.array(random.sample(range(self.length), batch_size))
+        return self.states[indexes], self.actions[indexes], self.rewards[indexes], self.next_states[indexes], self.dones[indexes]
@@ -0,0 +1,67 @@
+#!/usr/bin/python3
+# Usage (from the repository root): python3 -m benchmarks.backend
+import os
+import sys
+import time
+import multiprocessing as mp
+
+# Import some Python modules from the $SUMO_HOME/tools directory
+if 'SUMO_HOME' in os.environ:
+    TOOLS = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(TOOLS)
+else:
+    sys.exit("Please declare environment variable 'SUMO_HOME'")
+
+from generate_routefile import generate_routefile
+from simulators.connection import start_sumo
+from simulators.observation import create_observation
+import traci.constants as tc
+
+GREEN_PHASE_DURATION = 21
+YELLOW_PHASE_DURATION = 6
+
+
+# Run a whole episode cycling through the 4 green phases, with the calls a Simulator makes on every step
+def run_episode(mode, backend, max_steps, return_dict):
+    connection = start_sumo(mode + '-' + backend, 'environments/' + mode + '/tlcs_config_train.sumocfg', backend=backend)
+    observation = create_observation('vehicle', connection, 'TL')
+    connection.simulation.subscribe([tc.VAR_ARRIVED_VEHICLES_NUMBER])
+    throughput = 0
+
+    start_time = time.time()
+    for step in range(max_steps):
+        if step % (GREEN_PHASE_DURATION + YELLOW_PHASE_DURATION) == 0:
+            connection.trafficlight.setPhase('TL', (step // (GREEN_PHASE_DURATION + YELLOW_PHASE_DURATION)) % 4 * 2)
+        elif step % (GREEN_PHASE_DURATION + YELLOW_PHASE_DURATION) == GREEN_PHASE_DURATION:
+            connection.trafficlight.setPhase('TL', connection.trafficlight.getPhase('TL') + 1)
+        connection.simulationStep(float(step))
+        snapshot = observation.take_snapshot(connection.simulation.getSubscriptionResults()[tc.VAR_ARRIVED_VEHICLES_NUMBER])
+        snapshot.cell_state()
+        snapshot.waiting_time
+        snapshot.queue
+        throughput += snapshot.arrived_number
+    elapsed_time = time.time() - start_time
+
+    connection.close(False)
+    return_dict[backend] = (max_steps / elapsed_time, throughput)
+
+
+if __name__ == "__main__":
+    MAX_STEPS = 3600
+    SEED = 666
+
+    manager = mp.Manager()
+    for mode in ['low', 'high', 'north-south', 'east-west']:
+        generate_routefile(MAX_STEPS, SEED, mode)
+        return_dict = manager.dict()
+        # libsumo runs one simulation per process: every episode gets a fresh process
+        for backend in ['traci', 'libsumo']:
+            p = mp.Process(target=run_episode, args=(mode, backend, MAX_STEPS, return_dict))
+            p.start()
+            p.join()
+
+        traci_steps_per_second, traci_throughput = return_dict['traci']
+        libsumo_steps_per_second, libsumo_throughput = return_dict['libsumo']
+        # Same simulation, same results: only the transport changes
+        assert traci_throughput == libsumo_throughput
+        print('{:12} traci {:7.0f} steps/s, libsumo {:7.0f} steps/s ({:.2f}x)'.format(mode, traci_steps_per_second, libsumo_steps_per_second, libsumo_steps_per_second / traci_steps_per_second))
@@ -0,0 +1,43 @@
+#!/usr/bin/python3
+# Usage (from the repository root): python3 -m benchmarks.inference
+import os
+import time
+import numpy as np
+
+# CPU only
+os.environ['CUDA_VISIBLE_DEVICES'] = ''
+
+from feed_forward_dropout.DQNAgent import DQNAgent
+
+
+# Seconds per call of predict on batches of batch_size states
+def latency(predict, states, batch_size, iterations):
+    start_time = time.time()
+    for i in range(iterations):
+        predict(states[i % (len(states) - batch_size + 1):][:batch_size])
+    return (time.time() - start_time) / iterations
+
+
+if __name__ == "__main__":
+    # Same agent as feed_forward_dropout/web_agent_train.py
+    STATE_SIZE = 320
+    ACTION_SIZE = 4
+    ITERATIONS = 1000
+
+    agent = DQNAgent(state_size=STATE_SIZE, action_size=ACTION_SIZE)
+    rng = np.random.RandomState(0)
+    states = rng.rand(256, STATE_SIZE)
+
+    # Same Q-values and same greedy actions as the Keras model
+    keras_q_values = agent.model.predict(states)
+    numpy_q_values = agent.inference.predict(states)
+    print('max abs difference {:.3g}, same greedy action for {}/{} states'.format(
+        np.abs(keras_q_values - numpy_q_values).max(), np.sum(keras_q_values.argmax(axis=1) == numpy_q_values.argmax(axis=1)), len(states)))
+
+    # 1: one decision (act), 4: one decision per mode (act_batch)
+    for batch_size in [1, 4, 16]:
+        latency(agent.model.predict, states, batch_size, 10)
+        keras_latency = latency(agent.model.predict, states, batch_size, ITERATIONS)
+        numpy_latency = latency(agent.inference.predict, states, batch_size, ITERATIONS)
+        print('batch {:3}: model.predict {:7.3f} ms, NumPy {:7.3f} ms ({:.1f}x)'.format(
+            batch_size, keras_latency * 1000, numpy_latency * 1000, keras_latency / numpy_latency))
@@ -0,0 +1,78 @@
+#!/usr/bin/python3
+# Usage (from the repository root): python3 -m benchmarks.multi_junction
+import os
+import sys
+import math
+import time
+import tempfile
+import subprocess
+import numpy as np
+
+# Import some Python modules from the $SUMO_HOME/tools directory
+if 'SUMO_HOME' in os.environ:
+    TOOLS = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(TOOLS)
+else:
+    sys.exit("Please declare environment variable 'SUMO_HOME'")
+
+from sumolib import checkBinary  # Checks for the binary in environ vars
+from simulators.connection import start_sumo
+from simulators.multi_junction import MultiJunctionCore
+
+
+# Grid network with at least n_junctions traffic lights, random traffic on it
+def generate_scenario(n_junctions, directory, max_steps):
+    columns = math.ceil(math.sqrt(n_junctions))
+    rows = math.ceil(n_junctions / columns)
+    net_file = os.path.join(directory, 'grid.net.xml')
+    route_file = os.path.join(directory, 'grid.rou.xml')
+    sumocfg = os.path.join(directory, 'grid.sumocfg')
+    # 4 lanes per edge and arms attached to the border junctions, so every junction looks like the one in environments/
+    subprocess.check_call([checkBinary('netgenerate'), '--grid', '--grid.x-number', str(max(columns, 2)), '--grid.y-number', str(max(rows, 2)),
+                           '--grid.attach-length', '200', '--default.lanenumber', '4', '--default-junction-type', 'traffic_light',
+                           '--tls.default-type', 'static', '--no-turnarounds', 'true', '-o', net_file], stdout=subprocess.DEVNULL)
+    subprocess.check_call([sys.executable, os.path.join(TOOLS, 'randomTrips.py'), '-n', net_file, '-r', route_file, '-e', str(max_steps),
+                           '--period', str(2.0 / n_junctions), '--seed', '42'], stdout=subprocess.DEVNULL)
+    with open(sumocfg, 'w') as f:
+        f.write('<configuration><input><net-file value="grid.net.xml"/><route-files value="grid.rou.xml"/></input>'
+                '<processing><time-to-teleport value="-1"/></processing></configuration>')
+    return net_file, sumocfg
+
+
+def run(n_junctions, max_steps):
+    with tempfile.TemporaryDirectory() as directory:
+        net_file, sumocfg = generate_scenario(n_junctions, directory, max_steps)
+        connection = start_sumo('grid-' + str(n_junctions), sumocfg)
+        tls_ids = sorted(connection.trafficlight.getIDList())[:n_junctions]
+        core = MultiJunctionCore(connection, tls_ids, net_file)
+        rng = np.random.RandomState(0)
+
+        simulation_time = 0
+        state_time = 0
+        phase_time = 0
+        for step in range(max_steps):
+            start_time = time.time()
+            if core.deciding().any():
+                core.set_actions(rng.randint(core.action_sizes))
+            phase_time += time.time() - start_time
+
+            start_time = time.time()
+            core.step(step)
+            simulation_time += time.time() - start_time
+
+            start_time = time.time()
+            core.update_states()
+            state_time += time.time() - start_time
+
+        phase_changes = core.phase_changes
+        connection.close(False)
+    return simulation_time / max_steps, state_time / max_steps, phase_time / max_steps, phase_changes
+
+
+if __name__ == "__main__":
+    MAX_STEPS = 600
+
+    for n_junctions in [1, 2, 5, 10, 20, 50]:
+        simulation_time, state_time, phase_time, phase_changes = run(n_junctions, MAX_STEPS)
+        print('{:3} junctions: step {:7.2f} ms, states {:7.2f} ms ({:.3f} ms per junction), phases {:5.2f} ms, {:5} setPhase calls'.format(
+            n_junctions, simulation_time * 1000, state_time * 1000, state_time * 1000 / n_junctions, phase_time * 1000, phase_changes))
@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+# Usage (from the repository root): python3 -m benchmarks.replay
+import os
+import time
+import numpy as np
+
+# CPU only
+os.environ['CUDA_VISIBLE_DEVICES'] = ''
+
+from feed_forward_dropout.DQNAgent import DQNAgent
+
+
+# Q-values of the states and of the next states of a minibatch, as replay computed them before: one predict per batch
+def two_predicts(agent, states, next_states):
+    currents_q_values = agent.model.predict(x=states, batch_size=agent.batch_size)
+    next_states_q_values = agent.model.predict(x=next_states, batch_size=agent.batch_size)
+    return currents_q_values, next_states_q_values
+
+
+# As replay computes them now: one forward pass over both batches
+def fused_predict(agent, states, next_states):
+    q_values = agent.model.predict_on_batch(np.concatenate([states, next_states]))
+    return q_values[:len(states)], q_values[len(states):]
+
+
+# Minibatches per second of the replay target computation (sampling, Q-values, TD targets), without the training step
+def run(agent, predict, iterations):
+    start_time = time.time()
+    for _ in range(iterations):
+        states, actions, rewards, next_states, dones = agent.memory.sample(agent.batch_size)
+        currents_q_values, next_states_q_values = predict(agent, states, next_states)
+        targets = rewards + agent.gamma * np.amax(next_states_q_values, axis=1) * (1 - dones)
+        currents_q_values[np.arange(len(actions)), actions] = targets
+    return iterations / (time.time() - start_time)
+
+
+if __name__ == "__main__":
+    # Same agent as feed_forward_dropout/web_agent_train.py
+    STATE_SIZE = 320
+    ACTION_SIZE = 4
+    MEMORY_SIZE = 1024
+    ITERATIONS = 200
+
+    rng = np.random.RandomState(0)
+    for batch_size in [32, 64, 256]:
+        agent = DQNAgent(state_size=STATE_SIZE, action_size=ACTION_SIZE, memory_size=MEMORY_SIZE, batch_size=batch_size)
+        for _ in range(MEMORY_SIZE):
+            agent.remember(rng.rand(STATE_SIZE), rng.randint(ACTION_SIZE), rng.randn(), rng.rand(STATE_SIZE), False)
+
+        # Same Q-values both ways
+        states, next_states = agent.memory.states[:batch_size], agent.memory.next_states[:batch_size]
+        for before, after in zip(two_predicts(agent, states, next_states), fused_predict(agent, states, next_states)):
+            assert np.allclose(before, after, atol=1e-5)
+
+        # Warm up (graph and session setup), then measure
+        run(agent, two_predicts, 10)
+        run(agent, fused_predict, 10)
+        before = run(agent, two_predicts, ITERATIONS)
+        after = run(agent, fused_predict, ITERATIONS)
+        print('batch {:4}: {:8.1f} replay iterations/s with two predicts, {:8.1f} with one fused forward pass ({:.2f}x)'.format(
+            batch_size, before, after, after / before))
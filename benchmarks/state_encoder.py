@@ -0,0 +1,135 @@
+#!/usr/bin/python3
+# Usage (from the repository root): python3 -m benchmarks.state_encoder
+import timeit
+from functools import reduce
+import numpy as np
+from benchmarks.synthetic import generate_subscription_results
+from simulators.geometry import DEFAULT_GEOMETRY
+from simulators.state_encoder import compute_cell_indexes, encode_vehicles, compute_cell_state
+
+
+# String based position indexing used by the simulators before the lane lookup table
+def compute_position_index(vehicle):
+    # Initialize vehicle_position_index as -1 in order to not taking into account vehicles driving away from the tls later
+    vehicle_position_index = -1
+    # Lane position
+    lane_pos = vehicle[1][86]
+    # Lane ID
+    lane_id = vehicle[1][81]
+    # Lanes are 750m long, this calculate the distance from the tls
+    distance_from_tls = 750 - lane_pos
+    # Lane group initialization
+    lane_group = -1
+    # In which lane is the car? _3 are the "turn left only" lanes
+    if '_3' in lane_id:
+        if lane_id == 'W2TL_3':
+            lane_group = 1
+        elif lane_id == 'N2TL_3':
+            lane_group = 3
+        elif lane_id == 'E2TL_3':
+            lane_group = 5
+        elif lane_id == 'S2TL_3':
+            lane_group = 7
+    else:
+        if 'W2TL' in lane_id:
+            lane_group = 0
+        elif 'N2TL' in lane_id:
+            lane_group = 2
+        elif 'E2TL' in lane_id:
+            lane_group = 4
+        elif 'S2TL' in lane_id:
+            lane_group = 6
+
+    if 0 <= lane_group <= 7:
+        # distance in meters from the TLS -> mapping into cells
+        if 400 <= distance_from_tls <= 750:
+            lane_cell = 9
+        elif 160 <= distance_from_tls < 400:
+            lane_cell = 8
+        elif 100 <= distance_from_tls < 160:
+            lane_cell = 7
+        elif 60 <= distance_from_tls < 100:
+            lane_cell = 6
+        elif 40 <= distance_from_tls < 60:
+            lane_cell = 5
+        elif 28 <= distance_from_tls < 40:
+            lane_cell = 4
+        elif 21 <= distance_from_tls < 28:
+            lane_cell = 3
+        elif 14 <= distance_from_tls < 21:
+            lane_cell = 2
+        elif 7 <= distance_from_tls < 14:
+            lane_cell = 1
+        elif distance_from_tls < 7:
+            lane_cell = 0
+        # composition of the two postion ID to create a number in the interval 0-79
+        vehicle_position_index = lane_group * 10 + lane_cell
+
+    return vehicle_position_index
+
+
+# Per vehicle implementation used by the simulators before the vectorized encoder
+def compute_car_state(vehicle):
+    position = np.zeros(80)
+    speed = np.zeros(80)
+    waiting_time = np.zeros(80)
+    queue_status = np.zeros(80)
+
+    vehicle_position_index = compute_position_index(vehicle)
+
+    if vehicle_position_index > -1:
+        position[vehicle_position_index] = 1
+        speed[vehicle_position_index] = vehicle[1][64]
+        if vehicle[1][122] > 0.5:
+            queue_status[vehicle_position_index] = 1
+            waiting_time[vehicle_position_index] = vehicle[1][122]
+
+    return position, speed, waiting_time, queue_status
+
+
+def legacy_cell_state(vehicles):
+    positions, speeds, waiting_times, queue_statuses = zip(*map(compute_car_state, vehicles))
+    cars_per_cell = reduce(np.add, positions)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        average_speed_per_cell = np.nan_to_num(np.divide(reduce(np.add, speeds), cars_per_cell))
+    cumulated_waiting_time_per_cell = reduce(np.add, waiting_times)
+    queue_per_cell = reduce(np.add, queue_statuses)
+    return cars_per_cell, average_speed_per_cell, cumulated_waiting_time_per_cell, queue_per_cell
+
+
+def vectorized_cell_state(vehicles):
+    return compute_cell_state(*encode_vehicles(vehicles))
+
+
+def legacy_position_indexes(vehicles):
+    return [compute_position_index(vehicle) for vehicle in vehicles]
+
+
+def table_position_indexes(vehicles):
+    lane_indexes = np.array([DEFAULT_GEOMETRY.lane_indexes.get(vehicle[1][81], -1) for vehicle in vehicles])
+    lane_positions = np.array([vehicle[1][86] for vehicle in vehicles])
+    return compute_cell_indexes(lane_indexes, lane_positions)
+
+
+if __name__ == "__main__":
+    REPEAT = 20
+
+    for n_cars in [600, 3000, 6000]:
+        subscription_results = generate_subscription_results(n_cars)
+        # Filter out all the vehicles that are driving away from TLS, as the simulators do
+        vehicles = list(filter(lambda x: '2TL' in x[1][81], subscription_results.items()))
+
+        for legacy, vectorized in zip(legacy_cell_state(vehicles), vectorized_cell_state(vehicles)):
+            assert np.array_equal(legacy, vectorized)
+
+        assert np.array_equal(legacy_position_indexes(vehicles), table_position_indexes(vehicles))
+
+        legacy_time = timeit.timeit(lambda: legacy_position_indexes(vehicles), number=REPEAT) / REPEAT
+        table_time = timeit.timeit(lambda: table_position_indexes(vehicles), number=REPEAT) / REPEAT
+        print('{} cars: position index string logic {:.2f} ms, lookup table {:.2f} ms, speedup {:.1f}x'.format(
+            n_cars, legacy_time * 1000, table_time * 1000, legacy_time / table_time))
+
+        legacy_time = timeit.timeit(lambda: legacy_cell_state(vehicles), number=REPEAT) / REPEAT
+        vectorized_time = timeit.timeit(lambda: vectorized_cell_state(vehicles), number=REPEAT) / REPEAT
+        print('{} cars: legacy {:.2f} ms, vectorized {:.2f} ms, speedup {:.1f}x'.format(
+            n_cars, legacy_time * 1000, vectorized_time * 1000, legacy_time / vectorized_time))
@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+# Usage (from the repository root): python3 -m benchmarks.subscription
+import os
+import sys
+import time
+import numpy as np
+
+# Import some Python modules from the $SUMO_HOME/tools directory
+if 'SUMO_HOME' in os.environ:
+    TOOLS = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(TOOLS)
+else:
+    sys.exit("Please declare environment variable 'SUMO_HOME'")
+
+from sumolib import checkBinary  # Checks for the binary in environ vars
+import traci
+from generate_routefile import generate_routefile
+from simulators.observation import create_observation
+from benchmarks.traci_counters import count_socket
+
+
+# Run a whole episode with the default tls program, parsing the observation on every step
+def run_episode(mode, observation, max_steps):
+    label = mode + '-' + observation
+    traci.start([checkBinary('sumo'), '-c', 'environments/' + mode + '/tlcs_config_train.sumocfg', '--no-step-log', 'true'], label=label)
+    connection = traci.getConnection(label)
+    counter = count_socket(connection)
+    obs = create_observation(observation, connection, 'TL')
+
+    start_time = time.time()
+    for step in range(max_steps):
+        connection.simulationStep(float(step))
+        snapshot = obs.take_snapshot()
+        snapshot.cell_state()
+        snapshot.waiting_time
+        snapshot.queue
+    elapsed_time = time.time() - start_time
+
+    connection.close(False)
+    return counter.bytes_received, elapsed_time
+
+
+# Run a whole episode with the 'junction' observation and the given per vehicle observations subscribed together,
+# check they see the same vehicles on every step: same cells, waiting time and queue
+def check_same_traffic(mode, max_steps, observations=('vehicle', )):
+    label = mode + '-check'
+    traci.start([checkBinary('sumo'), '-c', 'environments/' + mode + '/tlcs_config_train.sumocfg', '--no-step-log', 'true'], label=label)
+    connection = traci.getConnection(label)
+    reference = create_observation('junction', connection, 'TL')
+    others = {observation: create_observation(observation, connection, 'TL') for observation in observations}
+
+    try:
+        for step in range(max_steps):
+            connection.simulationStep(float(step))
+            expected = reference.take_snapshot()
+            for observation, obs in others.items():
+                snapshot = obs.take_snapshot()
+                same_cells = all(np.allclose(a, b) for a, b in zip(expected.cell_state(), snapshot.cell_state()))
+                if not (same_cells and np.isclose(snapshot.waiting_time, expected.waiting_time) and snapshot.queue == expected.queue):
+                    raise AssertionError("'{}' observation differs from 'junction' in mode '{}' at step {}".format(observation, mode, step))
+    finally:
+        connection.close(False)
+
+
+if __name__ == "__main__":
+    MAX_STEPS = 3600
+    SEED = 666
+
+    for mode in ['low', 'high', 'north-south', 'east-west']:
+        generate_routefile(MAX_STEPS, SEED, mode)
+        check_same_traffic(mode, MAX_STEPS)
+        results = {observation: run_episode(mode, observation, MAX_STEPS) for observation in ['junction', 'vehicle', 'lane']}
+        junction_bytes, junction_time = results['junction']
+        for observation, (received, elapsed_time) in results.items():
+            print('{:12} {:9} {:8.2f} MB received ({:5.1f}% saved), {:6.2f} s ({:5.1f}% saved)'.format(
+                mode, observation, received / 1e6, 100 * (1 - received / junction_bytes),
+                elapsed_time, 100 * (1 - elapsed_time / junction_time)))
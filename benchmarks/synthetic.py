@@ -0,0 +1,22 @@
+import numpy as np
+
+INCOMING_EDGES = ['W2TL', 'N2TL', 'E2TL', 'S2TL']
+OUTGOING_EDGES = ['TL2W', 'TL2N', 'TL2E', 'TL2S']
+
+
+# Build a fake junction context subscription result with the same layout TraCI returns:
+# {vehicle_id: {VAR_SPEED: .., VAR_LANE_ID: .., VAR_LANEPOSITION: .., VAR_WAITING_TIME: ..}}
+def generate_subscription_results(n_cars, seed=0):
+    rng = np.random.RandomState(seed)
+    edges = INCOMING_EDGES * 3 + OUTGOING_EDGES
+    subscription_results = {}
+    for i in range(n_cars):
+        lane_id = edges[rng.randint(len(edges))] + '_' + str(rng.randint(4))
+        waiting_time = 0.0 if rng.rand() < 0.5 else float(rng.exponential(30))
+        subscription_results['veh_' + str(i)] = {
+            64: 0.0 if waiting_time > 0 else float(rng.uniform(0, 14)),
+            81: lane_id,
+            86: float(rng.uniform(0, 750)),
+            122: waiting_time,
+        }
+    return subscription_results
@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+# Usage (from the repository root): python3 -m benchmarks.traci_calls
+import os
+import sys
+import time
+
+# Import some Python modules from the $SUMO_HOME/tools directory
+if 'SUMO_HOME' in os.environ:
+    TOOLS = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(TOOLS)
+else:
+    sys.exit("Please declare environment variable 'SUMO_HOME'")
+
+from sumolib import checkBinary  # Checks for the binary in environ vars
+import traci
+import traci.constants as tc
+from generate_routefile import generate_routefile
+from simulators.observation import create_observation
+from benchmarks.traci_counters import count_socket
+
+
+# Run a whole episode reading the arrived number and the tls phase on every step (as the GRU simulator does),
+# with one get call each ('calls') or from the simulation and trafficlight subscriptions ('subscriptions')
+def run_episode(mode, variant, max_steps):
+    label = mode + '-' + variant
+    traci.start([checkBinary('sumo'), '-c', 'environments/' + mode + '/tlcs_config_train.sumocfg', '--no-step-log', 'true'], label=label)
+    connection = traci.getConnection(label)
+    observation = create_observation('vehicle', connection, 'TL')
+    if variant == 'subscriptions':
+        connection.simulation.subscribe([tc.VAR_ARRIVED_VEHICLES_NUMBER])
+        connection.trafficlight.subscribe('TL', [tc.TL_CURRENT_PHASE])
+    # Count from here: the setup commands are sent once per episode
+    counter = count_socket(connection)
+
+    start_time = time.time()
+    for step in range(max_steps):
+        connection.simulationStep(float(step))
+        if variant == 'subscriptions':
+            arrived_number = connection.simulation.getSubscriptionResults()[tc.VAR_ARRIVED_VEHICLES_NUMBER]
+            connection.trafficlight.getSubscriptionResults('TL')[tc.TL_CURRENT_PHASE]
+        else:
+            arrived_number = connection.simulation.getArrivedNumber()
+            connection.trafficlight.getPhase('TL')
+        snapshot = observation.take_snapshot(arrived_number)
+        snapshot.cell_state()
+    elapsed_time = time.time() - start_time
+
+    connection.close(False)
+    return counter.messages_sent / max_steps, elapsed_time
+
+
+if __name__ == "__main__":
+    MAX_STEPS = 3600
+    SEED = 666
+
+    for mode in ['low', 'high', 'north-south', 'east-west']:
+        generate_routefile(MAX_STEPS, SEED, mode)
+        calls_per_step, calls_time = run_episode(mode, 'calls', MAX_STEPS)
+        subscriptions_per_step, subscriptions_time = run_episode(mode, 'subscriptions', MAX_STEPS)
+        print('{:12} TraCI commands per step: {:4.2f} with get calls, {:4.2f} with subscriptions, {:6.2f} s -> {:6.2f} s'.format(
+            mode, calls_per_step, subscriptions_per_step, calls_time, subscriptions_time))
@@ -0,0 +1,27 @@
+# Count what goes through the TraCI socket of a connection
+class CountingSocket:
+
+    def __init__(self, socket):
+        self.socket = socket
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.messages_sent = 0
+
+    def send(self, data):
+        self.bytes_sent += len(data)
+        self.messages_sent += 1
+        return self.socket.send(data)
+
+    def recv(self, bufsize):
+        data = self.socket.recv(bufsize)
+        self.bytes_received += len(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.socket, name)
+
+
+def count_socket(connection):
+    # traci.Connection talks to SUMO through its private _socket attribute
+    connection._socket = CountingSocket(connection._socket)
+    return connection._socket
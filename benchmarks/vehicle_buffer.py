@@ -0,0 +1,54 @@
+#!/usr/bin/python3
+# Usage (from the repository root): python3 -m benchmarks.vehicle_buffer
+import time
+import tracemalloc
+from benchmarks.synthetic import generate_subscription_results
+from benchmarks.state_encoder import legacy_cell_state
+from simulators.snapshot import StepSnapshot
+from simulators.vehicle_buffer import VehicleBuffer
+
+
+def legacy_step(subscription_results):
+    vehicles = list(filter(lambda x: '2TL' in x[1][81], subscription_results.items()))
+    return legacy_cell_state(vehicles)
+
+
+def snapshot_step(subscription_results):
+    snapshot = StepSnapshot(subscription_results)
+    return snapshot.cell_state(), snapshot.waiting_time, snapshot.queue
+
+
+def buffer_step(subscription_results, buffer):
+    snapshot = StepSnapshot(subscription_results, buffer=buffer)
+    return snapshot.cell_state(), snapshot.waiting_time, snapshot.queue
+
+
+# Average peak memory allocated while processing one step and average time per step
+def measure(step, steps_results):
+    # Warm up (buffer growth, lazy imports)
+    step(steps_results[0])
+    peaks = []
+    for subscription_results in steps_results:
+        # Tracing restarted for every step: the peak only covers this step (tracemalloc.reset_peak needs Python 3.9)
+        tracemalloc.start()
+        step(subscription_results)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peaks.append(peak)
+
+    start_time = time.time()
+    for subscription_results in steps_results:
+        step(subscription_results)
+    elapsed_time = (time.time() - start_time) / len(steps_results)
+    return sum(peaks) / len(peaks), elapsed_time
+
+
+if __name__ == "__main__":
+    STEPS = 20
+
+    for n_cars in [600, 3000, 6000]:
+        steps_results = [generate_subscription_results(n_cars, seed) for seed in range(STEPS)]
+        buffer = VehicleBuffer()
+        for name, step in [('legacy', legacy_step), ('snapshot', snapshot_step), ('buffer', lambda results: buffer_step(results, buffer))]:
+            peak, elapsed_time = measure(step, steps_results)
+            print('{} cars: {:8} peak {:8.1f} KB allocated per step, {:.2f} ms per step'.format(n_cars, name, peak / 1024, elapsed_time * 1000))
@@ -1,7 +1,13 @@
 import os
+import sys
 import random
-from collections import deque
+import time
 import numpy as np
+
+# The agents package is in the repository root, one level up: this directory is also run as a script (python3 feed_forward_dropout/web_agent_train.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from agents.replay_memory import ReplayMemory
+
 from keras.models import Model
 from keras.layers import Dense, Dropout, Input
 from keras.optimizers import Adam
@@ -36,12 +42,43 @@ epsilon = min_epsilon + (max_epsilon - min_epsilon)*np.exp(-epsilon_decay_rate*e
 '''
 
 
+# Activations the NumPy forward pass knows about
+ACTIVATIONS = ('relu', 'linear')
+
+
+class NumpyMLP:
+
+    # Forward pass of the Dense layers of a model with plain float32 NumPy matmuls, Dropout being the identity at inference.
+    # For the single state of a decision it costs the multiply-adds of the network only, without the graph and session overhead of model.predict.
+    # It holds a copy of the weights: update() after every change of the model (training round, load).
+    def __init__(self, model):
+        self.update(model)
+
+    def update(self, model):
+        dense_layers = [layer for layer in model.layers if isinstance(layer, Dense)]
+        self.activations = [layer.get_config()['activation'] for layer in dense_layers]
+        for activation in self.activations:
+            if activation not in ACTIVATIONS:
+                raise ValueError("Unknown activation '{}', expected one of {}".format(activation, list(ACTIVATIONS)))
+        self.weights = [layer.get_weights()[0].astype(np.float32) for layer in dense_layers]
+        self.biases = [layer.get_weights()[1].astype(np.float32) for layer in dense_layers]
+
+    def predict(self, states):
+        x = np.asarray(states, dtype=np.float32)
+        for weights, biases, activation in zip(self.weights, self.biases, self.activations):
+            x = np.dot(x, weights)
+            x += biases
+            if activation == 'relu':
+                np.maximum(x, 0, out=x)
+        return x
+
+
 class DQNAgent:
 
     def __init__(self, state_size, action_size, memory_size=200, gamma=0.95, epsilon=1.0, epsilon_decay_rate=0.995, epsilon_min=0.01, learning_rate=0.0002, sample_size=32, batch_size=32, name='DQNAgent'):
         self.state_size = state_size
         self.action_size = action_size
-        self.memory = deque(maxlen=memory_size)
+        self.memory = ReplayMemory(memory_size)
         self.gamma = gamma
         self.epsilon = epsilon
         self.epsilon_decay_rate = epsilon_decay_rate
@@ -49,6 +86,8 @@ class DQNAgent:
         self.learning_rate = learning_rate
         self.name = name
         self.model = self._build_model()
+        # act and act_batch evaluate this copy of the model
+        self.inference = NumpyMLP(self.model)
         self.sample_size = sample_size
         self.batch_size = batch_size
 
@@ -78,7 +117,7 @@ class DQNAgent:
 
     # Save a sample into memory
     def remember(self, state, action, reward, next_state, done):
-        self.memory.append((state, action, reward, next_state, done))
+        self.memory.append(state, action, reward, next_state, done)
 
     # Choose an action
     def act(self, state):
@@ -87,39 +126,35 @@ class DQNAgent:
             return random.randrange(self.action_size)
         # Transpose the state in order to feed it into the model
         state = state.reshape((1, self.state_size))
-        action_q_values = self.model.predict(state)
+        action_q_values = self.inference.predict(state)
         return np.argmax(action_q_values[0])
 
+    # Choose an action for each state of a batch (one state per environment) with a single predict
+    def act_batch(self, states):
+        states = np.asarray(states).reshape((-1, self.state_size))
+        actions = np.random.randint(self.action_size, size=len(states))
+        # Exploration is drawn per environment, only the greedy ones go through the model
+        greedy = np.random.rand(len(states)) > self.epsilon
+        if greedy.any():
+            action_q_values = self.inference.predict(states[greedy])
+            actions[greedy] = np.argmax(action_q_values, axis=1)
+        return actions
+
+    # One gradient step on a fresh minibatch, return its loss and accuracy
     def replay(self):
         # Sample from memory
-        minibatch = random.sample(self.memory, self.batch_size)
-
-        # Divide minibatch items' properties
-        states = np.asarray([item[0] for item in minibatch])
-        actions = np.asarray([item[1] for item in minibatch])
-        rewards = np.asarray([item[2] for item in minibatch])
-        next_states = np.asarray([item[3] for item in minibatch])
-
-        # Predict the Q-value for each actions of each state
-        currents_q_values = self.model.predict(x=states, batch_size=self.batch_size)
-        # Predict the Q-value for each actions of each next state
-        next_states_q_values = self.model.predict(x=next_states, batch_size=self.batch_size)
-
-        # Update the Q-value of the choosen action for each state
-        for current_q_values, action, reward, next_state_q_values in zip(currents_q_values, actions, rewards, next_states_q_values):
-            current_q_values[action] = reward + self.gamma * np.amax(next_state_q_values)
-
-        # Train the model
-        history = self.model.fit(
-            x=states,
-            y=currents_q_values,
-            epochs=200,
-            verbose=0,
-            batch_size=self.batch_size
-        )
+        states, actions, rewards, next_states, dones = self.memory.sample(self.batch_size)
 
-        loss = history.history['loss']
-        acc = history.history['acc']
+        # Predict the Q-value for each actions of each state and of each next state, with a single forward pass over both batches
+        q_values = self.model.predict_on_batch(np.concatenate([states, next_states]))
+        currents_q_values, next_states_q_values = q_values[:len(states)], q_values[len(states):]
+
+        # Update the Q-value of the choosen action for each state: Bellman target, no bootstrap from the last transition of an episode
+        targets = rewards + self.gamma * np.amax(next_states_q_values, axis=1) * (1 - dones)
+        currents_q_values[np.arange(len(actions)), actions] = targets
+
+        # Train the model: a single update, no per epoch setup and callbacks as with fit
+        loss, acc = self.model.train_on_batch(states, currents_q_values)
 
         return loss, acc
 
@@ -127,9 +162,20 @@ class DQNAgent:
         # if self.epsilon > self.epsilon_min:
         #     self.epsilon *= self.epsilon_decay_rate
 
+    # Run a budget of gradient steps, each one on a fresh minibatch: return the mean loss, the mean accuracy and the updates per second
+    def train(self, gradient_steps):
+        losses = np.zeros(gradient_steps)
+        accuracies = np.zeros(gradient_steps)
+        start_time = time.time()
+        for step in range(gradient_steps):
+            losses[step], accuracies[step] = self.replay()
+        self.inference.update(self.model)
+        return losses.mean(), accuracies.mean(), gradient_steps / (time.time() - start_time)
+
     # Load a pre-trained model
     def load(self):
         self.model.load_weights(self.name + '_weights')
+        self.inference.update(self.model)
 
     # Load save the current model
     def save(self):
@@ -2,9 +2,6 @@ import os
 import sys
 import requests
 from ast import literal_eval
-# This module exports a set of functions implemented in C corresponding to the intrinsic operators of Python. For example, operator.add(x, y) is equivalent to the expression x+y. The function names are those used for special methods; variants without leading and trailing '__' are also provided for convenience.
-import operator
-from functools import reduce
 import numpy as np
 import time
 
@@ -15,8 +12,10 @@ if 'SUMO_HOME' in os.environ:
 else:
     sys.exit("Please declare environment variable 'SUMO_HOME'")
 
-from sumolib import checkBinary  # Checks for the binary in environ vars
-import traci
+from simulators.connection import start_sumo
+from simulators.geometry import get_net_file
+from simulators.multi_junction import MultiJunctionCore
+from simulators.state_encoder import normalize_cell_state
 import traci.constants as tc
 
 # Duration of green phase
@@ -24,301 +23,115 @@ GREEN_PHASE_DURATION = 21
 # Duration of yellow phase
 YELLOW_PHASE_DURATION = 6
 
-# phase codes based on xai_tlcs.net.xml
-PHASE_NS_GREEN = 0
-PHASE_NS_YELLOW = 1
-PHASE_NSL_GREEN = 2
-PHASE_NSL_YELLOW = 3
-PHASE_EW_GREEN = 4
-PHASE_EW_YELLOW = 5
-PHASE_EWL_GREEN = 6
-PHASE_EWL_YELLOW = 7
-
-
-def extract_waiting_time(vehicle):
-    # Return the waiting time only for the vehicle in queue
-    if vehicle[1][122] > 0.5:
-        return vehicle[1][122]
-    return 0
-
-
-def is_queued(vehicle):
-    return vehicle[1][122] > 0.5
-
-
-def compute_position_index(vehicle):
-    # Initialize vehicle_position_index as -1 in order to not taking into account vehicles driving away from the tls later
-    vehicle_position_index = -1
-    # Lane position
-    lane_pos = vehicle[1][86]
-    # Lane ID
-    lane_id = vehicle[1][81]
-    # Lanes are 750m long, this calculate the distance from the tls
-    distance_from_tls = 750 - lane_pos
-    # Lane group initialization
-    lane_group = -1
-    # In which lane is the car? _3 are the "turn left only" lanes
-    if '_3' in lane_id:
-        if lane_id == 'W2TL_3':
-            lane_group = 1
-        elif lane_id == 'N2TL_3':
-            lane_group = 3
-        elif lane_id == 'E2TL_3':
-            lane_group = 5
-        elif lane_id == 'S2TL_3':
-            lane_group = 7
-    else:
-        if 'W2TL' in lane_id:
-            lane_group = 0
-        elif 'N2TL' in lane_id:
-            lane_group = 2
-        elif 'E2TL' in lane_id:
-            lane_group = 4
-        elif 'S2TL' in lane_id:
-            lane_group = 6
-
-    if 0 <= lane_group <= 7:
-        # distance in meters from the TLS -> mapping into cells
-        if 400 <= distance_from_tls <= 750:
-            lane_cell = 9
-        elif 160 <= distance_from_tls < 400:
-            lane_cell = 8
-        elif 100 <= distance_from_tls < 160:
-            lane_cell = 7
-        elif 60 <= distance_from_tls < 100:
-            lane_cell = 6
-        elif 40 <= distance_from_tls < 60:
-            lane_cell = 5
-        elif 28 <= distance_from_tls < 40:
-            lane_cell = 4
-        elif 21 <= distance_from_tls < 28:
-            lane_cell = 3
-        elif 14 <= distance_from_tls < 21:
-            lane_cell = 2
-        elif 7 <= distance_from_tls < 14:
-            lane_cell = 1
-        elif distance_from_tls < 7:
-            lane_cell = 0
-        # composition of the two postion ID to create a number in the interval 0-79
-        vehicle_position_index = int(str(lane_group) + str(lane_cell))
-
-    return vehicle_position_index
-
-
-def compute_car_state(vehicle):
-    # Save the position of the vehicle as a point (vector) in a multi-dimensional space for faster computations
-    position = np.zeros(80)
-    # Save the speed of the vehicle as a point (vector) in a multi-dimensional space for faster computations
-    speed = np.zeros(80)
-    # Save the waiting_time of the vehicle as a point (vector) in a multi-dimensional space for faster computations
-    waiting_time = np.zeros(80)
-    # Save the queue_status of the vehicle as a point (vector) in a multi-dimensional space for faster computations
-    queue_status = np.zeros(80)
-
-    vehicle_position_index = compute_position_index(vehicle)
-
-    # Do not consider vehicles driving away from the tls
-    if vehicle_position_index > -1:
-        position[vehicle_position_index] = 1
-        speed[vehicle_position_index] = vehicle[1][64]
-        if vehicle[1][122] > 0.5:
-            queue_status[vehicle_position_index] = 1
-            waiting_time[vehicle_position_index] = vehicle[1][122]
-
-    return position, speed, waiting_time, queue_status
-
 
 class Simulator:
 
-    def __init__(self, label, sumocfg, state_size, max_steps, gui=False):
+    # tls_ids: the traffic lights driven by the agent, each junction decides on its own state with the same agent
+    # (the junction shipped in environments/ by default)
+    def __init__(self, label, sumocfg, state_size, max_steps, gui=False, observation='vehicle', backend=None, tls_ids=None):
         self.sumocfg = sumocfg
         self.state_size = state_size
         self.max_steps = max_steps
+        # State of an empty junction, shared by every idle decision
+        self.empty_state = np.zeros(state_size)
+        self.empty_state.flags.writeable = False
         # stats
         self.cumulative_reward = 0
         self.cumulative_waiting_time = 0
         self.throughput = 0
         self.cumulative_intersection_queue = 0
-        # tls state
-        self.yellow_phase = False
-        self.green_phase = False
-        self.yellow_phase_step_count = 0
-        self.green_phase_step_count = 0
-        # action
-        self.action = None
-        self.previous_action = None
 
         self.label = label
-        self.junction_id = 'TL'
-        self.current_waiting_time = 0
-
-        # Control SUMO mode (with or without GUI)
-        if gui:
-            sumo_binary = checkBinary('sumo-gui')
-        else:
-            sumo_binary = checkBinary('sumo')
-
-        # Start SUMO with TraCI and some flags
-        traci.start([sumo_binary, "-c", self.sumocfg, "--no-step-log", "true"], label=self.label)
-
-        self.connection = traci.getConnection(self.label)
-
-        # The following code retrieves all vehicle speeds and waiting times within range (1000m) of a junction (the vehicle ids are retrieved implicitly). The values retrieved are always the ones from the last time step, it is not possible to retrieve older values.
-        # add tc.VAR_ACCUMULATED_WAITING_TIME, tc.VAR_POSITION if more than one tl
-        self.connection.junction.subscribeContext(self.junction_id, tc.CMD_GET_VEHICLE_VARIABLE, 1000, [tc.VAR_SPEED, tc.VAR_LANEPOSITION, tc.VAR_LANE_ID, tc.VAR_WAITING_TIME])
-        # VAR_LANEPOSITION = 86
-        # VAR_LANE_ID = 81
-        # VAR_WAITING_TIME = 122
-        # VAR_ARRIVED_VEHICLES_NUMBER = 121
-        # VAR_SPEED = 64
-
-        self.state = self._get_state(self.junction_id)
-
-    def _compute_current_waiting_time(self, junction_id):
-        subscription_results = self.connection.junction.getContextSubscriptionResults(junction_id)
-        if subscription_results is not None:
-            vehicles = subscription_results.items()
-            return reduce(operator.add, map(extract_waiting_time, vehicles))
-        return 0
+        self.tls_ids = list(tls_ids) if tls_ids is not None else ['TL']
+
+        # Start SUMO (its own process behind TraCI, or inside this process with libsumo) and some flags
+        # Every vehicle is loaded up front, so the vehicles still expected are exactly the ones not arrived yet
+        self.connection = start_sumo(self.label, self.sumocfg, gui, backend, ['--route-steps', '0'])
+        # Number of vehicles still expected and arrived during the last step, delivered with the result of every simulationStep
+        # instead of one more call each: one TraCI round trip per step
+        self.connection.simulation.subscribe([tc.VAR_MIN_EXPECTED_VEHICLES, tc.VAR_ARRIVED_VEHICLES_NUMBER])
+        # Simulated seconds not run because the network had drained
+        self.skipped_steps = 0
+        # Decisions taken on an empty junction, without act call
+        self.idle_decisions = 0
+
+        # Phases of every tls, and one observation per junction: on the incoming lanes ('vehicle') or within 1000m of the junction ('junction'), one state cell per lane section, or the incoming lanes aggregates ('lane', one state cell per lane group)
+        # (lanes approaching each junction and their cells read from the net file, cached on disk)
+        self.core = MultiJunctionCore(self.connection, self.tls_ids, get_net_file(self.sumocfg), observation, GREEN_PHASE_DURATION, YELLOW_PHASE_DURATION)
+        # The agent network and empty_state are sized for state_size, the observation must produce states of that size
+        if self.core.state_size != self.state_size:
+            raise ValueError("state_size {} does not match the '{}' observation, expected {}".format(self.state_size, observation, self.core.state_size))
+
+        snapshots = self._take_snapshots()
+        # Per junction: state at the last decision point, and waiting time of the last step
+        self.states = [self._get_state(snapshot) for snapshot in snapshots]
+        self.waiting_times = [0] * len(self.tls_ids)
+        # No vehicle on the incoming lanes of the junction at its last decision point
+        self.idle = np.array([snapshot.empty for snapshot in snapshots])
+
+    # Parse the subscription results of the last simulation step once per junction, state, waiting time and queue are all read from it
+    def _take_snapshots(self):
+        return [observation.take_snapshot() for observation in self.core.observations]
 
     def _compute_reward(self, current_waiting_time, previous_waiting_time, step):
         return previous_waiting_time - current_waiting_time
 
-    def _compute_throughput(self):
-        return self.connection.simulation.getArrivedNumber()
-
-    def _compute_queue(self, junction_id):
-        subscription_results = self.connection.junction.getContextSubscriptionResults(junction_id)
-        queue = 0
-        if subscription_results is not None:
-            vehicles = subscription_results.items()
-            queue = reduce(operator.add, map(is_queued, vehicles))
-        return queue
+    def _get_state(self, snapshot):
+        if snapshot.empty:
+            return self.empty_state
 
-    def _get_state(self, junction_id):
-        subscription_results = self.connection.junction.getContextSubscriptionResults(junction_id)
         state = np.zeros(self.state_size)
 
-        if subscription_results is not None:
-            vehicles = subscription_results.items()
-            # Filter out all the vehicles that are driving away from TLS
-            vehicles = list(filter(lambda x: '2TL' in x[1][81], vehicles))
-
-            cars_per_cell = np.zeros(80)
-            average_speed_per_cell = np.zeros(80)
-            cumulated_waiting_time_per_cell = np.zeros(80)
-            queue_per_cell = np.zeros(80)
-            cars_per_cell_normalized = np.zeros(80)
-            average_speed_per_cell_normalized = np.zeros(80)
-            cumulated_waiting_time_per_cell_normalized = np.zeros(80)
-            queue_per_cell_normalized = np.zeros(80)
-
-            if len(vehicles) > 0:
-                positions, speeds, waiting_times, queue_statuses = zip(*map(compute_car_state, vehicles))
-
-                # number of cars per cell going to the tls
-                cars_per_cell = reduce(np.add, positions)
-                if sum(cars_per_cell) > 0:
-                    cars_per_cell_normalized = cars_per_cell / sum(cars_per_cell)
-                # average speed per cell / ignore divide by zero warnings
-                with np.errstate(divide='ignore', invalid='ignore'):
-                    average_speed_per_cell = np.nan_to_num(np.divide(reduce(np.add, speeds), cars_per_cell))
-                    average_speed_per_cell_normalized = average_speed_per_cell / 26
-                # cumulated waiting time per cell
-                cumulated_waiting_time_per_cell = reduce(np.add, waiting_times)
-                if sum(cumulated_waiting_time_per_cell) > 0:
-                    cumulated_waiting_time_per_cell_normalized = cumulated_waiting_time_per_cell / sum(cumulated_waiting_time_per_cell)
-                # number of cars queued per cell
-                queue_per_cell = reduce(np.add, queue_statuses)
-                if sum(queue_per_cell) > 0:
-                    queue_per_cell_normalized = queue_per_cell / sum(queue_per_cell)
-
-            state = np.concatenate([cars_per_cell_normalized, average_speed_per_cell_normalized, cumulated_waiting_time_per_cell_normalized, queue_per_cell_normalized])
+        if snapshot.has_results:
+            # number of cars, average speed, cumulated waiting time and number of cars queued per cell going to the tls, normalized
+            normalize_cell_state(*snapshot.cell_state(), out=state)
 
         return state
 
     # Check if the episode is finished (not very useful here, but often used in Reinforcement Learning tasks)
     def _is_done(self, step):
-        return step < self.max_steps - 1
+        return step >= self.max_steps - 1
 
-    def do_step(self, step):
-        # Choose self.action and (start yellow phase or execute self.action)
-        if not self.green_phase and not self.yellow_phase:
-            # Let the agent choose action
-            # Store previous action
-            self.previous_action = self.action
-            # Choose action
-            self.action = requests.post('http://127.0.0.1:5000/act', json={'states': self.state.tolist()}).json()['action']
-            # Start yellow phase
-            if self.action != self.previous_action and self.previous_action is not None:
-                self.yellow_phase = True
-                # print('start yellow phase')
-                # yellow phase based on previous action
-                if self.previous_action == 0:
-                    self.connection.trafficlight.setPhase('TL', PHASE_NS_YELLOW)
-                elif self.previous_action == 1:
-                    self.connection.trafficlight.setPhase('TL', PHASE_NSL_YELLOW)
-                elif self.previous_action == 2:
-                    self.connection.trafficlight.setPhase('TL', PHASE_EW_YELLOW)
-                elif self.previous_action == 3:
-                    self.connection.trafficlight.setPhase('TL', PHASE_EWL_YELLOW)
-            # Continue green phase
-            else:
-                self.green_phase = True
-                if self.action == 0:
-                    self.connection.trafficlight.setPhase("TL", PHASE_NS_GREEN)
-                elif self.action == 1:
-                    self.connection.trafficlight.setPhase("TL", PHASE_NSL_GREEN)
-                elif self.action == 2:
-                    self.connection.trafficlight.setPhase("TL", PHASE_EW_GREEN)
-                elif self.action == 3:
-                    self.connection.trafficlight.setPhase("TL", PHASE_EWL_GREEN)
+    # One action per state: /act for a single junction, /act_batch for several
+    def _act(self, states):
+        if len(states) == 1:
+            return [requests.post('http://127.0.0.1:5000/act', json={'states': states[0].tolist()}).json()['action']]
+        return requests.post('http://127.0.0.1:5000/act_batch', json={'states': [state.tolist() for state in states]}).json()['actions']
 
-        # Do step
-        self.connection.simulationStep(float(step))
-
-        # Update yellow phase counter
-        if self.yellow_phase:
-            # print('update yellow phase counter')
-            self.yellow_phase_step_count += 1
-            # Reset yellow phase
-            if self.yellow_phase_step_count == YELLOW_PHASE_DURATION:
-                # print('reset yellow phase count')
-                self.yellow_phase = False
-                self.yellow_phase_step_count = 0
-                # Execute action / Start green phase
-                self.green_phase = True
-                if self.action == 0:
-                    self.connection.trafficlight.setPhase("TL", PHASE_NS_GREEN)
-                elif self.action == 1:
-                    self.connection.trafficlight.setPhase("TL", PHASE_NSL_GREEN)
-                elif self.action == 2:
-                    self.connection.trafficlight.setPhase("TL", PHASE_EW_GREEN)
-                elif self.action == 3:
-                    self.connection.trafficlight.setPhase("TL", PHASE_EWL_GREEN)
-        # Update green phase counter
-        elif self.green_phase:
-            # print('update green phase counter')
-            self.green_phase_step_count += 1
-            # Reset green phase
-            if self.green_phase_step_count == GREEN_PHASE_DURATION:
-                # print('reset green phase count')
-                self.green_phase = False
-                self.green_phase_step_count = 0
-                self.state = self._get_state(self.junction_id)
+    def do_step(self, step):
+        # Let the agent choose the action of every deciding junction and (start yellow phase or execute the action)
+        deciding = self.core.deciding()
+        if deciding.any():
+            asking = deciding & ~self.idle
+            # Nothing to decide on an empty junction, the green phase goes on (the first one is action 0)
+            actions = np.where(self.core.actions > -1, self.core.actions, 0)
+            if asking.any():
+                actions[asking] = self._act([self.states[index] for index in np.flatnonzero(asking).tolist()])
+            self.idle_decisions += int(np.count_nonzero(deciding & self.idle))
+            self.core.set_actions(actions)
+
+        # Do step, the tls timers follow (green phase after the yellow one)
+        ended = self.core.step(step)
+        snapshots = self._take_snapshots()
+
+        # New state of the junctions whose green phase ended
+        for index in np.flatnonzero(ended).tolist():
+            self.states[index] = self._get_state(snapshots[index])
+            self.idle[index] = snapshots[index].empty
 
         # Compute stats
-        current_queue = self._compute_queue(self.junction_id)
-        previous_waiting_time = self.current_waiting_time
-        self.current_waiting_time = self._compute_current_waiting_time(self.junction_id)
-        reward = self._compute_reward(self.current_waiting_time, previous_waiting_time, step)
+        for index, snapshot in enumerate(snapshots):
+            current_queue = snapshot.queue
+            previous_waiting_time = self.waiting_times[index]
+            self.waiting_times[index] = snapshot.waiting_time
+            reward = self._compute_reward(self.waiting_times[index], previous_waiting_time, step)
 
-        # Update
-        self.cumulative_reward += reward
-        self.cumulative_waiting_time += self.current_waiting_time
-        self.cumulative_intersection_queue += current_queue
+            # Update
+            self.cumulative_reward += reward
+            self.cumulative_waiting_time += self.waiting_times[index]
+            self.cumulative_intersection_queue += current_queue
 
-        self.throughput += self._compute_throughput()
+        self.throughput += self.connection.simulation.getSubscriptionResults()[tc.VAR_ARRIVED_VEHICLES_NUMBER]
 
     # end simulation
     def stop(self):
@@ -330,7 +143,16 @@ class Simulator:
 
         return self.cumulative_reward, avg_waiting_time, avg_intersection_queue, self.throughput
 
+    # Nothing left to drive: no vehicle in the network and none to come
+    def _drained(self):
+        return self.connection.simulation.getSubscriptionResults()[tc.VAR_MIN_EXPECTED_VEHICLES] == 0
+
     def run(self, max_steps):
         for step in range(0, max_steps):
+            # Every next step would add no waiting time, no queue and no reward: the averages over max_steps are the same.
+            # Checked between two phases of every junction only, so the green phase the last vehicle left in gets its reward first.
+            if self.core.deciding().all() and step > 0 and self._drained():
+                self.skipped_steps = max_steps - step
+                break
             self.do_step(step)
         return self.stop()
@@ -2,9 +2,6 @@ import os
 import sys
 import requests
 from ast import literal_eval
-# This module exports a set of functions implemented in C corresponding to the intrinsic operators of Python. For example, operator.add(x, y) is equivalent to the expression x+y. The function names are those used for special methods; variants without leading and trailing '__' are also provided for convenience.
-import operator
-from functools import reduce
 import numpy as np
 import time
 
@@ -15,8 +12,12 @@ if 'SUMO_HOME' in os.environ:
 else:
     sys.exit("Please declare environment variable 'SUMO_HOME'")
 
-from sumolib import checkBinary  # Checks for the binary in environ vars
-import traci
+from simulators.connection import start_sumo, load_sumo
+from simulators.demand import count_vehicles
+from simulators.state_cache import StateCache
+from simulators.geometry import get_net_file
+from simulators.multi_junction import MultiJunctionCore
+from simulators.state_encoder import normalize_cell_state
 import traci.constants as tc
 
 # Duration of green phase
@@ -24,325 +25,271 @@ GREEN_PHASE_DURATION = 21
 # Duration of yellow phase
 YELLOW_PHASE_DURATION = 6
 
-# phase codes based on xai_tlcs.net.xml
-PHASE_NS_GREEN = 0
-PHASE_NS_YELLOW = 1
-PHASE_NSL_GREEN = 2
-PHASE_NSL_YELLOW = 3
-PHASE_EW_GREEN = 4
-PHASE_EW_YELLOW = 5
-PHASE_EWL_GREEN = 6
-PHASE_EWL_YELLOW = 7
-
-
-def extract_waiting_time(vehicle):
-    # Return the waiting time only for the vehicle in queue
-    if vehicle[1][122] > 0.5:
-        return vehicle[1][122]
-    return 0
-
-
-def is_queued(vehicle):
-    return vehicle[1][122] > 0.5
-
-
-def compute_position_index(vehicle):
-    # Initialize vehicle_position_index as -1 in order to not taking into account vehicles driving away from the tls later
-    vehicle_position_index = -1
-    # Lane position
-    lane_pos = vehicle[1][86]
-    # Lane ID
-    lane_id = vehicle[1][81]
-    # Lanes are 750m long, this calculate the distance from the tls
-    distance_from_tls = 750 - lane_pos
-    # Lane group initialization
-    lane_group = -1
-    # In which lane is the car? _3 are the "turn left only" lanes
-    if '_3' in lane_id:
-        if lane_id == 'W2TL_3':
-            lane_group = 1
-        elif lane_id == 'N2TL_3':
-            lane_group = 3
-        elif lane_id == 'E2TL_3':
-            lane_group = 5
-        elif lane_id == 'S2TL_3':
-            lane_group = 7
-    else:
-        if 'W2TL' in lane_id:
-            lane_group = 0
-        elif 'N2TL' in lane_id:
-            lane_group = 2
-        elif 'E2TL' in lane_id:
-            lane_group = 4
-        elif 'S2TL' in lane_id:
-            lane_group = 6
-
-    if 0 <= lane_group <= 7:
-        # distance in meters from the TLS -> mapping into cells
-        if 400 <= distance_from_tls <= 750:
-            lane_cell = 9
-        elif 160 <= distance_from_tls < 400:
-            lane_cell = 8
-        elif 100 <= distance_from_tls < 160:
-            lane_cell = 7
-        elif 60 <= distance_from_tls < 100:
-            lane_cell = 6
-        elif 40 <= distance_from_tls < 60:
-            lane_cell = 5
-        elif 28 <= distance_from_tls < 40:
-            lane_cell = 4
-        elif 21 <= distance_from_tls < 28:
-            lane_cell = 3
-        elif 14 <= distance_from_tls < 21:
-            lane_cell = 2
-        elif 7 <= distance_from_tls < 14:
-            lane_cell = 1
-        elif distance_from_tls < 7:
-            lane_cell = 0
-        # composition of the two postion ID to create a number in the interval 0-79
-        vehicle_position_index = int(str(lane_group) + str(lane_cell))
-
-    return vehicle_position_index
-
-
-def compute_car_state(vehicle):
-    # Save the position of the vehicle as a point (vector) in a multi-dimensional space for faster computations
-    position = np.zeros(80)
-    # Save the speed of the vehicle as a point (vector) in a multi-dimensional space for faster computations
-    speed = np.zeros(80)
-    # Save the waiting_time of the vehicle as a point (vector) in a multi-dimensional space for faster computations
-    waiting_time = np.zeros(80)
-    # Save the queue_status of the vehicle as a point (vector) in a multi-dimensional space for faster computations
-    queue_status = np.zeros(80)
-
-    vehicle_position_index = compute_position_index(vehicle)
-
-    # Do not consider vehicles driving away from the tls
-    if vehicle_position_index > -1:
-        position[vehicle_position_index] = 1
-        speed[vehicle_position_index] = vehicle[1][64]
-        if vehicle[1][122] > 0.5:
-            queue_status[vehicle_position_index] = 1
-            waiting_time[vehicle_position_index] = vehicle[1][122]
-
-    return position, speed, waiting_time, queue_status
+STEPPINGS = ('step', 'event')
+
+
+# Feed the memory of the web agent
+def post_remember(state, action, reward, next_state, done):
+    requests.post('http://127.0.0.1:5000/remember', json={
+        'state': state.tolist(),
+        'action': action,
+        'reward': reward,
+        'next_state': next_state.tolist(),
+        'done': done
+    })
 
 
 class Simulator:
 
-    def __init__(self, label, sumocfg, state_size, max_steps, gui=False):
+    # tls_ids: the traffic lights driven by the agent, each junction decides on its own state with the same agent
+    # (the junction shipped in environments/ by default)
+    def __init__(self, label, sumocfg, state_size, max_steps, gui=False, observation='vehicle', backend=None, stepping='step', route_file=None, remember=None, warmup_time=0, state_cache=None, tls_ids=None):
         self.sumocfg = sumocfg
         self.state_size = state_size
         self.max_steps = max_steps
+        # State of an empty junction, shared by every idle decision
+        self.empty_state = np.zeros(state_size)
+        self.empty_state.flags.writeable = False
+
+        self.label = label
+        self.tls_ids = list(tls_ids) if tls_ids is not None else ['TL']
+        # Lanes approaching each junction and their cells are read from the net file (cached on disk)
+        self.net_file = get_net_file(self.sumocfg)
+        self.observation_name = observation
+
+        # 'step': one simulationStep per second, 'event': one simulationStep per phase change, straight to the next decision
+        if stepping not in STEPPINGS:
+            raise ValueError("Unknown stepping '{}', expected one of {}".format(stepping, list(STEPPINGS)))
+        self.stepping = stepping
+
+        # Start SUMO (its own process behind TraCI, or inside this process with libsumo) and some flags
+        # Every vehicle is loaded up front, so the vehicles still expected are exactly the ones not arrived yet
+        # (throughput of event stepping, end of the episode once the network has drained)
+        self.sumo_options = ['--route-steps', '0']
+        # Route file replacing the one of the configuration, so several simulators can share an environment
+        self.route_file = route_file
+        if route_file is not None:
+            self.sumo_options += ['--route-files', route_file]
+        self.connection = start_sumo(self.label, self.sumocfg, gui, backend, self.sumo_options)
+
+        # Episodes start at warmup_time, the network state at that time is loaded from the cache once simulated
+        self.warmup_time = warmup_time
+        self.state_cache = state_cache or (StateCache() if warmup_time > 0 else None)
+
+        # Where the transitions go: the web agent by default, or any callable(state, action, reward, next_state, done)
+        self.remember = remember or post_remember
+
+        # Phases of every tls and one observation per junction, created with the first episode
+        self.core = None
+        self._start_episode()
+
+    def _start_episode(self):
         # stats
         self.cumulative_reward = 0
         self.cumulative_waiting_time = 0
         self.throughput = 0
         self.cumulative_intersection_queue = 0
-        # tls state
-        self.yellow_phase = False
-        self.green_phase = False
-        self.yellow_phase_step_count = 0
-        self.green_phase_step_count = 0
-        # action
-        self.action = None
-        self.previous_action = None
-
-        self.label = label
-        self.junction_id = 'TL'
-        self.current_waiting_time = 0
-
-        # Control SUMO mode (with or without GUI)
-        if gui:
-            sumo_binary = checkBinary('sumo-gui')
+        # Simulated seconds not run because the network had drained
+        self.skipped_steps = 0
+        # Decisions taken on an empty junction: no act call, no transition for the agent memory
+        self.idle_decisions = 0
+        self.idle_transitions = 0
+
+        route_files = [self.route_file] if self.route_file is not None else None
+        self.vehicle_number = count_vehicles(self.sumocfg, route_files) if self.stepping == 'event' else None
+
+        # Skip the warm-up: the first step of the episode is warmup_time
+        self.start_step = 0
+        if self.warmup_time > 0:
+            self.state_cache.warm_start(self.connection, self.sumocfg, self.warmup_time, route_files, self.sumo_options)
+            self.start_step = self.warmup_time
+        # Number of vehicles still expected and arrived during the last step, delivered with the result of every simulationStep
+        # instead of one more call each: one TraCI round trip per step
+        self.connection.simulation.subscribe([tc.VAR_MIN_EXPECTED_VEHICLES, tc.VAR_ARRIVED_VEHICLES_NUMBER])
+        # Vehicles arrived during the warm-up do not count in the throughput of the episode
+        self.arrived_offset = self.vehicle_number - self._expected_vehicles() if self.stepping == 'event' and self.start_step > 0 else 0
+
+        # Subscribe to the vehicles on the incoming lanes ('vehicle') or within 1000m of the junction ('junction'), one state cell per lane section, or to the incoming lanes aggregates ('lane', one state cell per lane group).
+        # Every tls starts without action, the first decision of each junction starts a green phase.
+        if self.core is None:
+            self.core = MultiJunctionCore(self.connection, self.tls_ids, self.net_file, self.observation_name, GREEN_PHASE_DURATION, YELLOW_PHASE_DURATION)
         else:
-            sumo_binary = checkBinary('sumo')
-
-        # Start SUMO with TraCI and some flags
-        traci.start([sumo_binary, "-c", self.sumocfg, "--no-step-log", "true"], label=self.label)
-
-        self.connection = traci.getConnection(self.label)
-
-        # The following code retrieves all vehicle speeds and waiting times within range (1000m) of a junction (the vehicle ids are retrieved implicitly). The values retrieved are always the ones from the last time step, it is not possible to retrieve older values.
-        # add tc.VAR_ACCUMULATED_WAITING_TIME, tc.VAR_POSITION if more than one tl
-        self.connection.junction.subscribeContext(self.junction_id, tc.CMD_GET_VEHICLE_VARIABLE, 1000, [tc.VAR_SPEED, tc.VAR_LANEPOSITION, tc.VAR_LANE_ID, tc.VAR_WAITING_TIME])
-        # VAR_LANEPOSITION = 86
-        # VAR_LANE_ID = 81
-        # VAR_WAITING_TIME = 122
-        # VAR_ARRIVED_VEHICLES_NUMBER = 121
-        # VAR_SPEED = 64
-
-        self.state = self._get_state(self.junction_id)
-
-    def _compute_current_waiting_time(self, junction_id):
-        subscription_results = self.connection.junction.getContextSubscriptionResults(junction_id)
-        if subscription_results is not None:
-            vehicles = subscription_results.items()
-            return reduce(operator.add, map(extract_waiting_time, vehicles))
-        return 0
+            self.core.reset()
+        # The agent network and empty_state are sized for state_size, the observation must produce states of that size
+        if self.core.state_size != self.state_size:
+            raise ValueError("state_size {} does not match the '{}' observation, expected {}".format(self.state_size, self.observation_name, self.core.state_size))
+
+        snapshots = [self._take_snapshot(index) for index in range(len(self.tls_ids))]
+        # Per junction: state at the last decision point, and waiting time the next reward is measured from.
+        # After a warm start the network is not empty: the first reward is measured from the waiting time at the start of the episode
+        self.states = [self._get_state(snapshot) for snapshot in snapshots]
+        self.waiting_times = [snapshot.waiting_time for snapshot in snapshots]
+        # No vehicle on the incoming lanes of the junction at its last decision point
+        self.idle = np.array([snapshot.empty for snapshot in snapshots])
+
+    # Start the next episode in the same SUMO process: reload the configuration, and with it the route file generated for the episode.
+    # No new binary to launch and no TraCI port negotiation. The subscriptions do not survive the load, _start_episode renews them.
+    def reset(self):
+        load_sumo(self.connection, self.sumocfg, self.sumo_options)
+        self._start_episode()
+
+    # Parse the subscription results of a junction for the last simulation step once, state, waiting time and queue are all read from it
+    def _take_snapshot(self, index):
+        return self.core.observations[index].take_snapshot()
+
+    # Vehicles arrived during the last step
+    def _arrived_number(self):
+        return self.connection.simulation.getSubscriptionResults()[tc.VAR_ARRIVED_VEHICLES_NUMBER]
+
+    # Vehicles running or still to depart, as of the last simulation step
+    def _expected_vehicles(self):
+        return self.connection.simulation.getSubscriptionResults()[tc.VAR_MIN_EXPECTED_VEHICLES]
+
+    # Nothing left to drive: no vehicle in the network and none to come
+    def _drained(self):
+        return self._expected_vehicles() == 0
 
     def _compute_reward(self, current_waiting_time, previous_waiting_time):
         return previous_waiting_time - current_waiting_time
 
-    def _compute_throughput(self):
-        return self.connection.simulation.getArrivedNumber()
-
-    def _compute_queue(self, junction_id):
-        subscription_results = self.connection.junction.getContextSubscriptionResults(junction_id)
-        queue = 0
-        if subscription_results is not None:
-            vehicles = subscription_results.items()
-            queue = reduce(operator.add, map(is_queued, vehicles))
-        return queue
+    def _get_state(self, snapshot):
+        if snapshot.empty:
+            return self.empty_state
 
-    def _get_state(self, junction_id):
-        subscription_results = self.connection.junction.getContextSubscriptionResults(junction_id)
         state = np.zeros(self.state_size)
 
-        if subscription_results is not None:
-            vehicles = subscription_results.items()
-            # Filter out all the vehicles that are driving away from TLS
-            vehicles = list(filter(lambda x: '2TL' in x[1][81], vehicles))
-
-            cars_per_cell = np.zeros(80)
-            average_speed_per_cell = np.zeros(80)
-            cumulated_waiting_time_per_cell = np.zeros(80)
-            queue_per_cell = np.zeros(80)
-            cars_per_cell_normalized = np.zeros(80)
-            average_speed_per_cell_normalized = np.zeros(80)
-            cumulated_waiting_time_per_cell_normalized = np.zeros(80)
-            queue_per_cell_normalized = np.zeros(80)
-
-            if len(vehicles) > 0:
-                positions, speeds, waiting_times, queue_statuses = zip(*map(compute_car_state, vehicles))
-
-                # number of cars per cell going to the tls
-                cars_per_cell = reduce(np.add, positions)
-                if sum(cars_per_cell) > 0:
-                    cars_per_cell_normalized = cars_per_cell / sum(cars_per_cell)
-                # average speed per cell / ignore divide by zero warnings
-                with np.errstate(divide='ignore', invalid='ignore'):
-                    average_speed_per_cell = np.nan_to_num(np.divide(reduce(np.add, speeds), cars_per_cell))
-                    average_speed_per_cell_normalized = average_speed_per_cell / 26
-                # cumulated waiting time per cell
-                cumulated_waiting_time_per_cell = reduce(np.add, waiting_times)
-                if sum(cumulated_waiting_time_per_cell) > 0:
-                    cumulated_waiting_time_per_cell_normalized = cumulated_waiting_time_per_cell / sum(cumulated_waiting_time_per_cell)
-                # number of cars queued per cell
-                queue_per_cell = reduce(np.add, queue_statuses)
-                if sum(queue_per_cell) > 0:
-                    queue_per_cell_normalized = queue_per_cell / sum(queue_per_cell)
-
-            state = np.concatenate([cars_per_cell_normalized, average_speed_per_cell_normalized, cumulated_waiting_time_per_cell_normalized, queue_per_cell_normalized])
+        if snapshot.has_results:
+            # number of cars, average speed, cumulated waiting time and number of cars queued per cell going to the tls, normalized
+            normalize_cell_state(*snapshot.cell_state(), out=state)
 
         return state
 
     # Check if the episode is finished (not very useful here, but often used in Reinforcement Learning tasks)
     def _is_done(self, step):
-        return step < self.max_steps - 1
+        return step >= self.max_steps - 1
+
+    # Junctions the agent decides for now: between two phases, and not empty
+    def _asking(self):
+        return self.core.deciding() & ~self.idle
+
+    # What the agent decides on: one state per junction in _asking, in tls_ids order
+    def decision_states(self):
+        return [self.states[index] for index in np.flatnonzero(self._asking()).tolist()]
+
+    # One action per state: /act for a single junction, /act_batch for several
+    def _act(self, states):
+        if len(states) == 1:
+            return [requests.post('http://127.0.0.1:5000/act', json={'states': states[0].tolist()}).json()['action']]
+        return requests.post('http://127.0.0.1:5000/act_batch', json={'states': [state.tolist() for state in states]}).json()['actions']
+
+    # Let the agent choose the action of every deciding junction (unless given, one per decision state, chosen by a batched act)
+    # and (start yellow phase or execute the action)
+    def _choose_actions(self, actions=None):
+        deciding = self.core.deciding()
+        asking = deciding & ~self.idle
+        # Nothing to decide on an empty junction, the green phase goes on (the first one is action 0)
+        next_actions = np.where(self.core.actions > -1, self.core.actions, 0)
+        if asking.any():
+            if actions is None:
+                actions = self._act(self.decision_states())
+            next_actions[asking] = actions
+        self.idle_decisions += int(np.count_nonzero(deciding & self.idle))
+        self.core.set_actions(next_actions)
+
+    # Reward the actions at the end of their green phase and feed the agent memory, one transition per junction
+    def _end_green_phases(self, ended, step):
+        done = self._is_done(step)
+        for index in np.flatnonzero(ended).tolist():
+            snapshot = self._take_snapshot(index)
+            # Compute stats
+            current_queue = snapshot.queue
+            previous_waiting_time = self.waiting_times[index]
+            self.waiting_times[index] = snapshot.waiting_time
+            reward = self._compute_reward(self.waiting_times[index], previous_waiting_time)
+
+            next_state = self._get_state(snapshot)
+            # Feed agent memory, unless the agent did not choose the action
+            if self.idle[index]:
+                self.idle_transitions += 1
+            else:
+                self.remember(self.states[index], int(self.core.actions[index]), reward, next_state, done)
+
+            # Update
+            self.states[index] = next_state
+            self.idle[index] = snapshot.empty
+            self.cumulative_reward += reward
+            self.cumulative_waiting_time += self.waiting_times[index]
+            self.cumulative_intersection_queue += current_queue
 
     def do_step(self, step):
-        # Choose self.action and (start yellow phase or execute self.action)
-        if not self.green_phase and not self.yellow_phase:
-            # Let the agent choose action
-            # Store previous action
-            self.previous_action = self.action
-            # Choose action
-            self.action = requests.post('http://127.0.0.1:5000/act', json={'states': self.state.tolist()}).json()['action']
-            # Start yellow phase
-            if self.action != self.previous_action and self.previous_action is not None:
-                self.yellow_phase = True
-                # print('start yellow phase')
-                # yellow phase based on previous action
-                if self.previous_action == 0:
-                    self.connection.trafficlight.setPhase('TL', PHASE_NS_YELLOW)
-                elif self.previous_action == 1:
-                    self.connection.trafficlight.setPhase('TL', PHASE_NSL_YELLOW)
-                elif self.previous_action == 2:
-                    self.connection.trafficlight.setPhase('TL', PHASE_EW_YELLOW)
-                elif self.previous_action == 3:
-                    self.connection.trafficlight.setPhase('TL', PHASE_EWL_YELLOW)
-            # Continue green phase
-            else:
-                self.green_phase = True
-                if self.action == 0:
-                    self.connection.trafficlight.setPhase("TL", PHASE_NS_GREEN)
-                elif self.action == 1:
-                    self.connection.trafficlight.setPhase("TL", PHASE_NSL_GREEN)
-                elif self.action == 2:
-                    self.connection.trafficlight.setPhase("TL", PHASE_EW_GREEN)
-                elif self.action == 3:
-                    self.connection.trafficlight.setPhase("TL", PHASE_EWL_GREEN)
-
-        # Do step
-        self.connection.simulationStep(float(step))
-
-        # Update yellow phase counter
-        if self.yellow_phase:
-            # print('update yellow phase counter')
-            self.yellow_phase_step_count += 1
-            # Reset yellow phase
-            if self.yellow_phase_step_count == YELLOW_PHASE_DURATION:
-                # print('reset yellow phase count')
-                self.yellow_phase = False
-                self.yellow_phase_step_count = 0
-                # Execute action / Start green phase
-                self.green_phase = True
-                if self.action == 0:
-                    self.connection.trafficlight.setPhase("TL", PHASE_NS_GREEN)
-                elif self.action == 1:
-                    self.connection.trafficlight.setPhase("TL", PHASE_NSL_GREEN)
-                elif self.action == 2:
-                    self.connection.trafficlight.setPhase("TL", PHASE_EW_GREEN)
-                elif self.action == 3:
-                    self.connection.trafficlight.setPhase("TL", PHASE_EWL_GREEN)
-        # Update green phase counter
-        elif self.green_phase:
-            # print('update green phase counter')
-            self.green_phase_step_count += 1
-            # Reset green phase
-            if self.green_phase_step_count == GREEN_PHASE_DURATION:
-                # print('reset green phase count')
-                self.green_phase = False
-                self.green_phase_step_count = 0
-
-                # Compute stats
-                current_queue = self._compute_queue(self.junction_id)
-                previous_waiting_time = self.current_waiting_time
-                self.current_waiting_time = self._compute_current_waiting_time(self.junction_id)
-                reward = self._compute_reward(self.current_waiting_time, previous_waiting_time)
-
-                done = self._is_done(step)
-
-                next_state = self._get_state(self.junction_id)
-                # Feed agent memory
-                requests.post('http://127.0.0.1:5000/remember', json={
-                    'state': self.state.tolist(),
-                    'action': self.action,
-                    'reward': reward,
-                    'next_state': next_state.tolist(),
-                    'done': done
-                })
-
-                # Update
-                self.state = next_state
-                self.cumulative_reward += reward
-                self.cumulative_waiting_time += self.current_waiting_time
-                self.cumulative_intersection_queue += current_queue
-
-        self.throughput += self._compute_throughput()
+        if self.core.deciding().any():
+            self._choose_actions()
+
+        # Do step, the tls timers follow (green phase after the yellow one)
+        ended = self.core.step(step)
+        if ended.any():
+            self._end_green_phases(ended, step)
+
+        self.throughput += self._arrived_number()
+
+    # Run SUMO up to the given step (at most max_steps) in a single call
+    def _advance(self, step, duration):
+        target_step = min(step + duration, self.max_steps)
+        self.connection.simulationStep(float(target_step))
+        # Arrivals of every step in between, the arrived number only counts the last one
+        self.throughput = self.vehicle_number - self._expected_vehicles() - self.arrived_offset
+        return target_step
+
+    # Event driven version of do_step: the agent only acts at phase boundaries, so run SUMO from one phase change of any
+    # junction to the next with one simulationStep each instead of one per second. Same phases, same rewards and stats as do_step.
+    # actions: one per decision state, None to let the web agent choose. Return the step of the next decision.
+    def do_decision(self, step, actions=None):
+        self._choose_actions(actions)
+
+        while True:
+            target_step = self._advance(step, self.core.next_event())
+            ended = self.core.advance(target_step - step)
+            step = target_step
+            if ended.any():
+                self._end_green_phases(ended, step - 1)
+                # Empty network between two phases of every junction: every next reward, waiting time and queue would be 0, end the episode here
+                if self.core.deciding().all() and self._drained():
+                    self.skipped_steps = self.max_steps - step
+                    return self.max_steps
+                return step
+            # A phase cut by the end of the episode is not rewarded, as in do_step
+            if step == self.max_steps:
+                return step
+
+    # Return the stats for this episode
+    def stats(self):
+        # Averaged over the steps of the episode, the warm-up excluded. The steps skipped once the network drained count
+        # (with no waiting time and no queue), so an episode ended early has the averages of the full one.
+        avg_waiting_time = self.cumulative_waiting_time / (self.max_steps - self.start_step)
+        avg_intersection_queue = self.cumulative_intersection_queue / (self.max_steps - self.start_step)
+
+        return self.cumulative_reward, avg_waiting_time, avg_intersection_queue, self.throughput, self.skipped_steps
 
     # end simulation
     def stop(self):
         self.connection.close(False)
-
-        # Return the stats for this episode
-        avg_waiting_time = self.cumulative_waiting_time / self.max_steps
-        avg_intersection_queue = self.cumulative_intersection_queue / self.max_steps
-
-        return self.cumulative_reward, avg_waiting_time, avg_intersection_queue, self.throughput
+        return self.stats()
+
+    # Run one episode, SUMO keeps running: reset() for the next one, stop() at the end
+    def run_episode(self, max_steps):
+        if self.stepping == 'event':
+            step = self.start_step
+            while step < max_steps:
+                step = self.do_decision(step)
+        else:
+            for step in range(self.start_step, max_steps):
+                # Same check as do_decision, between two phases of every junction: the last green phases have been rewarded already
+                if self.core.deciding().all() and step > self.start_step and self._drained():
+                    self.skipped_steps = max_steps - step
+                    break
+                self.do_step(step)
+        return self.stats()
 
     def run(self, max_steps):
-        for step in range(0, max_steps):
-            self.do_step(step)
+        self.run_episode(max_steps)
         return self.stop()
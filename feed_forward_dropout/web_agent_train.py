@@ -22,6 +22,8 @@ EPSILON_MIN = 0.01
 LEARNING_RATE = 0.0002
 SAMPLE_SIZE = 256
 BATCH_SIZE = 64
+# Gradient steps per episode (/replay), each one on a fresh minibatch: as many updates as the previous 100 fits of 200 epochs
+GRADIENT_STEPS = 20000
 NAME = 'ffdo_DQNAgent'
 
 # Create DQNAgent
@@ -70,17 +72,8 @@ def replay():
         print("----------------------------------------")
         print("---> Starting experience replay...")
         start_time = time.time()
-        losses = []
-        accuraces = []
-        # DQNAgent.replay()
-        for i in range(0, 100):
-            loss, acc = DQNAgent.replay()
-            losses.append(sum(loss)/len(loss))
-            accuraces.append(sum(acc)/len(acc))
-            # print(i, '-', 'Loss:', (sum(loss)/len(loss)), 'Accuracy:', (sum(acc)/len(acc)))
-
-        # losses, accuraces = DQNAgent.replay()
-        print('--->', 'Loss:', (sum(losses)/len(losses)), 'Accuracy:', (sum(accuraces)/len(accuraces)))
+        loss, acc, updates_per_second = DQNAgent.train(GRADIENT_STEPS)
+        print('--->', 'Loss:', loss, 'Accuracy:', acc, 'Updates/s:', round(updates_per_second, 1))
 
         # print(DQNAgent.epsilon)
         elapsed_time = round(time.time() - start_time, 2)
@@ -98,6 +91,14 @@ def act():
     return jsonify(action=action)
 
 
+# One action per environment of a VecSimulator decision tick
+@app.route('/act_batch', methods=['POST'])
+def act_batch():
+    states = request.get_json()['states']
+    actions = DQNAgent.act_batch(states)
+    return jsonify(actions=actions.tolist())
+
+
 @app.route('/save', methods=['POST'])
 def save():
     DQNAgent.save()
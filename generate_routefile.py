@@ -3,7 +3,8 @@ import math
 
 
 # generation of routes of cars
-def generate_routefile(max_steps, seed, mode):
+# route_file_path: where to write the routes, environments/<mode>/tlcs_train.rou.xml by default
+def generate_routefile(max_steps, seed, mode, route_file_path=None):
     # make tests reproducible
     np.random.seed(seed)
 
@@ -51,7 +52,8 @@ def generate_routefile(max_steps, seed, mode):
     car_gen_steps = np.rint(car_gen_steps)
 
     # produce the file for cars generation, one car per line
-    route_file_path = 'environments/' + mode + '/tlcs_train.rou.xml'
+    if route_file_path is None:
+        route_file_path = 'environments/' + mode + '/tlcs_train.rou.xml'
     routes_file = open(route_file_path, 'w')
     routes_file.write('''<routes>
     <vType accel="1.0" decel="4.5" id="standard_car" length="5.0" minGap="2.5" maxSpeed="25" sigma="0.5" />
@@ -0,0 +1,81 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+
+class ActionBatcher:
+
+    # Collect the act requests of the simulators and answer them with one act_batch call per event loop iteration:
+    # every simulator reaching a decision point while the loop is busy is served by the same predict.
+    def __init__(self, agent, loop):
+        self.agent = agent
+        self.loop = loop
+        self.states = []
+        self.futures = []
+        # Number of act_batch calls and of actions they returned
+        self.calls = 0
+        self.decisions = 0
+
+    def act(self, state):
+        future = self.loop.create_future()
+        if not self.futures:
+            self.loop.call_soon(self._flush)
+        self.states.append(state)
+        self.futures.append(future)
+        return future
+
+    def _flush(self):
+        states, futures = self.states, self.futures
+        self.states, self.futures = [], []
+        actions = self.agent.act_batch(states)
+        for future, action in zip(futures, actions):
+            future.set_result(int(action))
+        self.calls += 1
+        self.decisions += len(futures)
+
+
+class AsyncRunner:
+
+    # Drive many event stepping simulators (one TraCI connection, and so one SUMO process, each) from a single event loop,
+    # sharing one in-memory agent: no HTTP hop to the web agent and no agent copy per process.
+    # The blocking TraCI calls of a decision (do_decision) run in a thread pool, the socket waits release the GIL so all
+    # the SUMO instances step concurrently, while act, remember and replay stay on the event loop thread.
+    def __init__(self, simulators, agent, loop=None):
+        for sim in simulators:
+            if sim.stepping != 'event':
+                raise ValueError("AsyncRunner needs simulators created with stepping='event'")
+        self.simulators = list(simulators)
+        self.agent = agent
+        self.loop = loop or asyncio.get_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers=len(self.simulators))
+        self.batcher = ActionBatcher(agent, self.loop)
+        for sim in self.simulators:
+            sim.remember = self.remember
+
+    # Called from the simulator threads, the agent memory is only touched from the event loop thread
+    def remember(self, state, action, reward, next_state, done):
+        self.loop.call_soon_threadsafe(self.agent.remember, np.array(state), action, reward, np.array(next_state), done)
+
+    async def _run_simulator(self, sim, max_steps):
+        step = sim.start_step
+        while step < max_steps:
+            # The empty junctions choose their action themselves, they have no decision state
+            actions = await asyncio.gather(*[self.batcher.act(state) for state in sim.decision_states()])
+            step = await self.loop.run_in_executor(self.executor, sim.do_decision, step, list(actions))
+        return sim.stats()
+
+    async def _run_episode(self, max_steps):
+        return await asyncio.gather(*[self._run_simulator(sim, max_steps) for sim in self.simulators])
+
+    # Run one episode in every simulator, return the stats of each one
+    def run_episode(self, max_steps):
+        return self.loop.run_until_complete(self._run_episode(max_steps))
+
+    # Next episode in every simulator, the SUMO processes reload concurrently
+    def reset(self):
+        self.loop.run_until_complete(asyncio.gather(*[self.loop.run_in_executor(self.executor, sim.reset) for sim in self.simulators]))
+
+    def stop(self):
+        stats = [sim.stop() for sim in self.simulators]
+        self.executor.shutdown()
+        return stats
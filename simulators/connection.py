@@ -0,0 +1,60 @@
+import os
+from sumolib import checkBinary  # Checks for the binary in environ vars
+import traci
+
+# Backend used when the simulator does not ask for one: 'traci' (SUMO in its own process, TCP socket) or 'libsumo' (SUMO in this process)
+SUMO_BACKEND = os.environ.get('SUMO_BACKEND', 'traci')
+BACKENDS = ('traci', 'libsumo')
+
+
+class LibsumoConnection:
+
+    # libsumo exposes the TraCI API as module level domains (libsumo.simulation, libsumo.trafficlight, ...) and functions,
+    # this gives it the interface of a traci.Connection so the simulators do not care which one they drive.
+    # Every call is a plain C++ function call: no socket round-trip, no message encoding.
+    def __init__(self, libsumo):
+        self._libsumo = libsumo
+
+    def __getattr__(self, name):
+        # Only called for the attributes not found yet, keep them so the next lookups are plain attribute reads
+        attribute = getattr(self._libsumo, name)
+        setattr(self, name, attribute)
+        return attribute
+
+    def close(self, wait=True):
+        self._libsumo.close()
+
+
+# SUMO command line options, without the binary: options are extra SUMO command line options
+def sumo_arguments(sumocfg, options=()):
+    return ["-c", sumocfg, "--no-step-log", "true"] + list(options)
+
+
+def start_sumo(label, sumocfg, gui=False, backend=None, options=()):
+    backend = backend or SUMO_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError("Unknown SUMO backend '{}', expected one of {}".format(backend, list(BACKENDS)))
+
+    if backend == 'libsumo':
+        if gui:
+            raise ValueError("libsumo runs SUMO without GUI, use the 'traci' backend with gui=True")
+        # libsumo runs a single simulation per process: one Simulator per process (as train.py does)
+        import libsumo
+        libsumo.start([checkBinary('sumo')] + sumo_arguments(sumocfg, options))
+        return LibsumoConnection(libsumo)
+
+    # Control SUMO mode (with or without GUI)
+    if gui:
+        sumo_binary = checkBinary('sumo-gui')
+    else:
+        sumo_binary = checkBinary('sumo')
+
+    # Start SUMO with TraCI and some flags
+    traci.start([sumo_binary] + sumo_arguments(sumocfg, options), label=label)
+
+    return traci.getConnection(label)
+
+
+# Restart the simulation of a running SUMO (same process, same connection) from the given configuration
+def load_sumo(connection, sumocfg, options=()):
+    connection.load(sumo_arguments(sumocfg, options))
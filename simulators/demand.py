@@ -0,0 +1,22 @@
+import os
+import xml.etree.ElementTree as ElementTree
+
+
+# Route files of a SUMO configuration, unless given route files override them
+def get_route_files(sumocfg, route_files=None):
+    if route_files is None:
+        # The route file paths in the configuration are relative to the configuration itself
+        route_files = ElementTree.parse(sumocfg).getroot().find('input/route-files').get('value')
+        route_files = [os.path.join(os.path.dirname(sumocfg), route_file.strip()) for route_file in route_files.split(',')]
+    return route_files
+
+
+# Number of vehicles defined in the route files of a SUMO configuration, or in the given route files overriding them (flows are not expanded)
+def count_vehicles(sumocfg, route_files=None):
+    vehicle_number = 0
+    for route_file in get_route_files(sumocfg, route_files):
+        for _, element in ElementTree.iterparse(route_file):
+            if element.tag in ('vehicle', 'trip'):
+                vehicle_number += 1
+            element.clear()
+    return vehicle_number
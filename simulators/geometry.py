@@ -0,0 +1,93 @@
+import os
+import math
+import pickle
+import hashlib
+import xml.etree.ElementTree as ElementTree
+import numpy as np
+
+# Upper bounds of the cells (distance in meters from the tls), the last cell goes up to the end of the lane
+CELL_BOUNDARIES = np.array([7, 14, 21, 28, 40, 60, 100, 160, 400])
+# Parsed geometries are stored here, one file per (net file content, junction)
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.geometry_cache')
+
+
+class JunctionGeometry:
+
+    # Lanes approaching a junction and the cells they are divided into.
+    # Every incoming edge has two lane groups: the straight/right lanes and the left-most ("turn left only") lane.
+    def __init__(self, junction_id, incoming_lanes, cell_boundaries=CELL_BOUNDARIES):
+        # incoming_lanes: [(edge_id, [(lane_id, lane_length), ...] ordered by lane index), ...] in lane group order
+        self.junction_id = junction_id
+        self.incoming_edges = tuple(edge_id for edge_id, _ in incoming_lanes)
+        self.cell_boundaries = np.asarray(cell_boundaries)
+
+        lane_ids = []
+        lane_groups = []
+        lane_lengths = []
+        for edge_index, (edge_id, lanes) in enumerate(incoming_lanes):
+            for lane_index, (lane_id, lane_length) in enumerate(lanes):
+                lane_ids.append(lane_id)
+                lane_groups.append(edge_index * 2 + int(lane_index == len(lanes) - 1))
+                lane_lengths.append(lane_length)
+
+        self.lane_ids = tuple(lane_ids)
+        # Lane ID -> position in the lane arrays, looked up once per vehicle
+        self.lane_indexes = {lane_id: index for index, lane_id in enumerate(lane_ids)}
+        self.lane_groups = np.array(lane_groups, dtype=np.int64)
+        self.lane_lengths = np.array(lane_lengths, dtype=np.float64)
+
+        self.number_of_lane_groups = 2 * len(self.incoming_edges)
+        self.cells_per_lane_group = len(self.cell_boundaries) + 1
+        self.number_of_cells = self.number_of_lane_groups * self.cells_per_lane_group
+
+
+# Geometry of the intersection shipped in environments/: 4 incoming edges of 4 lanes, 750m long
+DEFAULT_GEOMETRY = JunctionGeometry('TL', [(edge_id, [(edge_id + '_' + str(lane_index), 750.0) for lane_index in range(4)]) for edge_id in ('W2TL', 'N2TL', 'E2TL', 'S2TL')])
+
+
+def parse_net_file(net_file, junction_id):
+    root = ElementTree.parse(net_file).getroot()
+    junction_positions = {junction.get('id'): (float(junction.get('x')), float(junction.get('y'))) for junction in root.iter('junction')}
+    junction_x, junction_y = junction_positions[junction_id]
+
+    incoming = []
+    for edge in root.iter('edge'):
+        if edge.get('function') == 'internal' or edge.get('to') != junction_id:
+            continue
+        from_x, from_y = junction_positions[edge.get('from')]
+        # Order the approaches clockwise starting from west (W, N, E, S for the default intersection)
+        angle = (math.pi - math.atan2(from_y - junction_y, from_x - junction_x)) % (2 * math.pi)
+        lanes = sorted(edge.iter('lane'), key=lambda lane: int(lane.get('index')))
+        incoming.append((angle, edge.get('id'), [(lane.get('id'), float(lane.get('length'))) for lane in lanes]))
+
+    incoming.sort(key=lambda approach: approach[0])
+    return JunctionGeometry(junction_id, [(edge_id, lanes) for _, edge_id, lanes in incoming])
+
+
+def load_geometry(net_file, junction_id='TL', cache_dir=CACHE_DIR):
+    with open(net_file, 'rb') as f:
+        net_hash = hashlib.sha1(f.read()).hexdigest()
+    cache_file = os.path.join(cache_dir, net_hash + '-' + junction_id + '.pickle')
+
+    if os.path.isfile(cache_file):
+        with open(cache_file, 'rb') as f:
+            return pickle.load(f)
+
+    geometry = parse_net_file(net_file, junction_id)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Several simulators may start at the same time, write aside and rename so nobody reads a partial file
+    temporary_file = cache_file + '.' + str(os.getpid())
+    with open(temporary_file, 'wb') as f:
+        pickle.dump(geometry, f)
+    os.replace(temporary_file, cache_file)
+    return geometry
+
+
+def get_net_file(sumocfg):
+    # The net file path in the configuration is relative to the configuration itself
+    net_file = ElementTree.parse(sumocfg).getroot().find('input/net-file').get('value')
+    return os.path.join(os.path.dirname(sumocfg), net_file)
+
+
+def load_geometry_from_sumocfg(sumocfg, junction_id='TL', cache_dir=CACHE_DIR):
+    return load_geometry(get_net_file(sumocfg), junction_id, cache_dir)
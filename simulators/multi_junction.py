@@ -0,0 +1,123 @@
+import numpy as np
+from simulators.geometry import load_geometry
+from simulators.observation import create_observation
+from simulators.state_encoder import normalize_cell_state
+
+# Duration of green phase
+GREEN_PHASE_DURATION = 21
+# Duration of yellow phase
+YELLOW_PHASE_DURATION = 6
+
+
+# Number of actions of a tls program laid out as MultiJunctionCore expects: green phase 2a, then its yellow phase 2a + 1
+def count_actions(tls_id, logic):
+    states = [phase.state for phase in logic.phases]
+    greens, yellows = states[0::2], states[1::2]
+    if not greens or len(greens) != len(yellows) or any('y' in green or 'G' not in green.upper() for green in greens) or any('y' not in yellow for yellow in yellows):
+        raise ValueError("tls '{}' program '{}' does not alternate green and yellow phases: {}".format(tls_id, logic.programID, states))
+    return len(greens)
+
+
+class MultiJunctionCore:
+
+    # Several traffic lights of one network driven together: one observation per junction, all the states in a single
+    # (n_junctions, state_size) array, and the phase timers of every junction as arrays advanced in one pass per step.
+    # The simulators build on it with tls_ids=['TL'] for the junction shipped in environments/.
+    # Every tls program alternates green and yellow phases: action a is green phase 2a, its yellow phase is 2a + 1
+    # (NS, NSL, EW and EWL green phases 0, 2, 4 and 6 for the junction shipped in environments/).
+    # The tls IDs are the IDs of their junctions, as netconvert names them.
+    def __init__(self, connection, tls_ids, net_file, observation='vehicle', green_phase_duration=GREEN_PHASE_DURATION, yellow_phase_duration=YELLOW_PHASE_DURATION):
+        self.connection = connection
+        self.tls_ids = list(tls_ids)
+        self.observation_name = observation
+        self.green_phase_duration = green_phase_duration
+        self.yellow_phase_duration = yellow_phase_duration
+
+        # Lanes approaching each junction and their cells, read from the net file (cached on disk)
+        self.geometries = [load_geometry(net_file, tls_id) for tls_id in self.tls_ids]
+        # Number of actions of each tls
+        self.action_sizes = np.array([count_actions(tls_id, connection.trafficlight.getAllProgramLogics(tls_id)[0]) for tls_id in self.tls_ids])
+        self.reset()
+
+    # Subscribe the observations again and start every tls over: the subscriptions do not survive a load of the simulation
+    def reset(self):
+        n_junctions = len(self.tls_ids)
+        self.observations = [create_observation(self.observation_name, self.connection, tls_id, geometry) for tls_id, geometry in zip(self.tls_ids, self.geometries)]
+        # Junctions with fewer approaches leave the end of their row to 0
+        self.state_size = max(obs.state_size for obs in self.observations)
+        self.states = np.zeros((n_junctions, self.state_size))
+        self.waiting_times = np.zeros(n_junctions)
+        self.queues = np.zeros(n_junctions)
+
+        # tls state, -1 before the first decision
+        self.actions = np.full(n_junctions, -1)
+        self.previous_actions = np.full(n_junctions, -1)
+        self.yellow_remaining = np.zeros(n_junctions, dtype=np.int64)
+        self.green_remaining = np.zeros(n_junctions, dtype=np.int64)
+        # Phase last set on each tls, and number of setPhase calls made
+        self.phases = np.full(n_junctions, -1)
+        self.phase_changes = 0
+
+    # Junctions waiting for an action: neither in yellow nor in green phase
+    def deciding(self):
+        return (self.yellow_remaining == 0) & (self.green_remaining == 0)
+
+    # Fill self.states, self.waiting_times and self.queues from the last simulation step
+    def update_states(self):
+        for index, observation in enumerate(self.observations):
+            snapshot = observation.take_snapshot()
+            if not snapshot.empty:
+                normalize_cell_state(*snapshot.cell_state(), out=self.states[index, :observation.state_size])
+            else:
+                self.states[index] = 0
+            self.waiting_times[index] = snapshot.waiting_time
+            self.queues[index] = snapshot.queue
+
+    # Give an action to every deciding junction (the actions of the other junctions are ignored):
+    # yellow phase first for the junctions changing action, green phase right away for the others
+    def set_actions(self, actions):
+        deciding = self.deciding()
+        changing = deciding & (self.actions > -1) & (self.actions != actions)
+        self.previous_actions = np.where(deciding, self.actions, self.previous_actions)
+        self.actions = np.where(deciding, actions, self.actions)
+        self.yellow_remaining[changing] = self.yellow_phase_duration
+        self.green_remaining[deciding & ~changing] = self.green_phase_duration
+        # Set the phase again even when it does not change, as the single junction simulators do, so the tls program does not move on
+        self.phases[deciding] = -1
+        self._apply_phases()
+
+    def _apply_phases(self):
+        phases = np.where(self.yellow_remaining > 0, self.previous_actions * 2 + 1, self.actions * 2)
+        # The junctions without an action yet keep the phase of their tls program
+        phases[self.actions < 0] = -1
+        changed = np.flatnonzero(phases != self.phases)
+        set_phase = self.connection.trafficlight.setPhase
+        for index in changed.tolist():
+            set_phase(self.tls_ids[index], int(phases[index]))
+        self.phases = phases
+        self.phase_changes += len(changed)
+
+    # Do one simulation step and advance the phase timers of every junction.
+    # Return the mask of the junctions whose green phase ended with this step (time to reward their action).
+    def step(self, step):
+        self.connection.simulationStep(float(step))
+        return self.advance(1)
+
+    # Steps until the next phase change of any junction (end of a yellow or of a green phase), at least one junction is in a phase
+    def next_event(self):
+        remaining = np.where(self.yellow_remaining > 0, self.yellow_remaining, self.green_remaining)
+        return int(remaining[remaining > 0].min())
+
+    # Advance the phase timers of every junction by duration simulated seconds, at most next_event(): the simulation has
+    # been run that far by the caller (event stepping, one simulationStep per phase change).
+    # Return the mask of the junctions whose green phase ended (time to reward their action).
+    def advance(self, duration):
+        in_yellow = self.yellow_remaining > 0
+        in_green = self.green_remaining > 0
+        self.yellow_remaining[in_yellow] -= duration
+        self.green_remaining[in_green] -= duration
+        # Execute action / Start green phase
+        self.green_remaining[in_yellow & (self.yellow_remaining == 0)] = self.green_phase_duration
+        self._apply_phases()
+
+        return in_green & (self.green_remaining == 0)
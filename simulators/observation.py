@@ -0,0 +1,141 @@
+import numpy as np
+import traci.constants as tc
+from simulators.snapshot import StepSnapshot
+from simulators.geometry import DEFAULT_GEOMETRY
+from simulators.vehicle_buffer import VehicleBuffer
+
+# Vehicles on a lane lie on its shape, the neighbouring lanes are at least 3.2m away
+LANE_CONTEXT_RANGE = 1
+# Variables subscribed for every vehicle
+VEHICLE_VARIABLES = [tc.VAR_SPEED, tc.VAR_LANEPOSITION, tc.VAR_LANE_ID, tc.VAR_WAITING_TIME]
+
+
+class JunctionObservation:
+
+    # 10 cells for each one of the 8 lane groups, built from the variables of every vehicle around the junction
+    def __init__(self, connection, junction_id, geometry=DEFAULT_GEOMETRY):
+        self.connection = connection
+        self.junction_id = junction_id
+        self.geometry = geometry
+        self.state_size = 4 * geometry.number_of_cells
+        # Columns reused by every snapshot of this observation
+        self.buffer = VehicleBuffer(geometry)
+
+        # The following code retrieves all vehicle speeds and waiting times within range (1000m) of a junction (the vehicle ids are retrieved implicitly). The values retrieved are always the ones from the last time step, it is not possible to retrieve older values.
+        # add tc.VAR_ACCUMULATED_WAITING_TIME, tc.VAR_POSITION if more than one tl
+        self.connection.junction.subscribeContext(self.junction_id, tc.CMD_GET_VEHICLE_VARIABLE, 1000, VEHICLE_VARIABLES)
+        # VAR_LANEPOSITION = 86
+        # VAR_LANE_ID = 81
+        # VAR_WAITING_TIME = 122
+        # VAR_ARRIVED_VEHICLES_NUMBER = 121
+        # VAR_SPEED = 64
+
+    def take_snapshot(self, arrived_number=0):
+        subscription_results = self.connection.junction.getContextSubscriptionResults(self.junction_id)
+        return StepSnapshot(subscription_results, arrived_number, self.geometry, self.buffer)
+
+
+class VehicleObservation:
+
+    # Same cells as JunctionObservation, but only the vehicles on the incoming lanes are subscribed:
+    # the vehicles driving away from the tls are never sent by SUMO, instead of being dropped in Python.
+    # SUMO context subscription filters (lanes, upstream distance, ...) only apply to vehicle ego objects,
+    # so every incoming lane gets its own context subscription on the vehicles lying on it.
+    # Per lane and not per edge: the shape of an edge only follows its outer lanes, the middle lanes are further than the range.
+    def __init__(self, connection, junction_id, geometry=DEFAULT_GEOMETRY):
+        self.connection = connection
+        self.junction_id = junction_id
+        self.geometry = geometry
+        self.state_size = 4 * geometry.number_of_cells
+        self.lane_ids = geometry.lane_ids
+        # Columns reused by every snapshot of this observation
+        self.buffer = VehicleBuffer(geometry)
+
+        for lane_id in self.lane_ids:
+            self.connection.lane.subscribeContext(lane_id, tc.CMD_GET_VEHICLE_VARIABLE, LANE_CONTEXT_RANGE, VEHICLE_VARIABLES)
+
+    def _subscription_results(self):
+        subscription_results = {}
+        for lane_id in self.lane_ids:
+            lane_results = self.connection.lane.getContextSubscriptionResults(lane_id)
+            if lane_results:
+                subscription_results.update(lane_results)
+        return subscription_results
+
+    def take_snapshot(self, arrived_number=0):
+        return StepSnapshot(self._subscription_results(), arrived_number, self.geometry, self.buffer)
+
+
+class LaneSnapshot:
+
+    # Same interface as StepSnapshot, built from the aggregated variables of the incoming lanes.
+    # Every lane group is a single cell: cars, average speed, waiting time and halting cars per lane group.
+    def __init__(self, lane_results, arrived_number=0, geometry=DEFAULT_GEOMETRY):
+        self.arrived_number = arrived_number
+        self.number_of_lane_groups = geometry.number_of_lane_groups
+        lane_ids = list(lane_results)
+        self.lane_groups = geometry.lane_groups[[geometry.lane_indexes[lane_id] for lane_id in lane_ids]]
+        self.vehicle_numbers = np.array([lane_results[lane_id][tc.LAST_STEP_VEHICLE_NUMBER] for lane_id in lane_ids], dtype=np.float64)
+        self.halting_numbers = np.array([lane_results[lane_id][tc.LAST_STEP_VEHICLE_HALTING_NUMBER] for lane_id in lane_ids], dtype=np.float64)
+        self.lane_waiting_times = np.array([lane_results[lane_id][tc.VAR_WAITING_TIME] for lane_id in lane_ids], dtype=np.float64)
+        self.mean_speeds = np.array([lane_results[lane_id][tc.LAST_STEP_MEAN_SPEED] for lane_id in lane_ids], dtype=np.float64)
+
+    @property
+    def has_results(self):
+        return True
+
+    # No vehicle on the incoming lanes
+    @property
+    def empty(self):
+        return not self.vehicle_numbers.any()
+
+    # Cumulated waiting time of the vehicles on the incoming lanes
+    @property
+    def waiting_time(self):
+        return float(self.lane_waiting_times.sum())
+
+    # Number of halting vehicles on the incoming lanes
+    @property
+    def queue(self):
+        return int(self.halting_numbers.sum())
+
+    def cell_state(self):
+        cars_per_lane_group = np.bincount(self.lane_groups, weights=self.vehicle_numbers, minlength=self.number_of_lane_groups)
+        # The mean speed of an empty lane is its maximum allowed speed, weight by the number of vehicles to ignore it
+        speed_per_lane_group = np.bincount(self.lane_groups, weights=self.mean_speeds * self.vehicle_numbers, minlength=self.number_of_lane_groups)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            average_speed_per_lane_group = np.nan_to_num(np.divide(speed_per_lane_group, cars_per_lane_group))
+        waiting_time_per_lane_group = np.bincount(self.lane_groups, weights=self.lane_waiting_times, minlength=self.number_of_lane_groups)
+        queue_per_lane_group = np.bincount(self.lane_groups, weights=self.halting_numbers, minlength=self.number_of_lane_groups)
+        return cars_per_lane_group, average_speed_per_lane_group, waiting_time_per_lane_group, queue_per_lane_group
+
+
+class LaneObservation:
+
+    # One state cell per lane group: much smaller TraCI payloads (16 lanes instead of every approaching vehicle)
+    def __init__(self, connection, junction_id, geometry=DEFAULT_GEOMETRY):
+        self.connection = connection
+        self.junction_id = junction_id
+        self.geometry = geometry
+        self.state_size = 4 * geometry.number_of_lane_groups
+        self.lane_ids = geometry.lane_ids
+
+        for lane_id in self.lane_ids:
+            self.connection.lane.subscribe(lane_id, [tc.LAST_STEP_VEHICLE_NUMBER, tc.LAST_STEP_VEHICLE_HALTING_NUMBER, tc.VAR_WAITING_TIME, tc.LAST_STEP_MEAN_SPEED])
+
+    def take_snapshot(self, arrived_number=0):
+        lane_results = {lane_id: self.connection.lane.getSubscriptionResults(lane_id) for lane_id in self.lane_ids}
+        return LaneSnapshot(lane_results, arrived_number, self.geometry)
+
+
+OBSERVATIONS = {
+    'junction': JunctionObservation,
+    'vehicle': VehicleObservation,
+    'lane': LaneObservation,
+}
+
+
+def create_observation(observation, connection, junction_id, geometry=DEFAULT_GEOMETRY):
+    if observation not in OBSERVATIONS:
+        raise ValueError("Unknown observation '{}', expected one of {}".format(observation, sorted(OBSERVATIONS)))
+    return OBSERVATIONS[observation](connection, junction_id, geometry)
@@ -0,0 +1,130 @@
+import os
+import time
+import random
+import traceback
+import multiprocessing as mp
+from queue import Empty
+from generate_routefile import generate_routefile
+
+# Vehicles generated per mode (generate_routefile), the cost estimate used to hand out the longest tasks first
+MODE_VEHICLES = {'low': 600, 'high': 6000, 'north-south': 3000, 'east-west': 3000}
+# How long an idle worker waits on its own queue before trying to steal again
+IDLE_TIMEOUT = 0.05
+
+
+# A task failed in a worker: raised by ScenarioScheduler.run, with the traceback of the worker in the message
+class WorkerError(Exception):
+    pass
+
+
+# Route file of one worker: every worker writes its own, whatever the mode
+def worker_route_file(mode, index):
+    return 'environments/' + mode + '/tlcs_train_w' + str(index) + '.rou.xml'
+
+
+# Persistent worker running (mode, seed) tasks: its own queue first, then the queues of the others (work stealing).
+# One simulator per mode the worker has run, reloaded (Simulator.reset) with the route file of each new task.
+def scheduler_worker(index, create_simulator, max_steps, queues, results, stop):
+    simulators = {}
+    others = [queue for i, queue in enumerate(queues) if i != index]
+    while not stop.is_set():
+        task = None
+        try:
+            task = queues[index].get_nowait()
+        except Empty:
+            random.shuffle(others)
+            for queue in others:
+                try:
+                    task = queue.get_nowait()
+                    break
+                except Empty:
+                    pass
+        if task is None:
+            # Nothing anywhere: wait for work on the own queue for a while, then look around again
+            try:
+                task = queues[index].get(timeout=IDLE_TIMEOUT)
+            except Empty:
+                continue
+
+        mode, seed = task
+        start_time = time.time()
+        try:
+            route_file = worker_route_file(mode, index)
+            generate_routefile(max_steps, seed, mode, route_file)
+            if mode not in simulators:
+                simulators[mode] = create_simulator(mode, max_steps, route_file)
+            else:
+                simulators[mode].reset()
+            stats = simulators[mode].run_episode(max_steps)
+        except Exception:
+            # Report the failure instead of leaving run waiting forever for the result of the task;
+            # the simulator of the mode may be in any state, the next task of the mode builds a new one
+            results.put(WorkerError('Worker {} failed on task {}:\n{}'.format(index, task, traceback.format_exc())))
+            sim = simulators.pop(mode, None)
+            if sim is not None:
+                try:
+                    sim.stop()
+                except Exception:
+                    pass
+            continue
+        results.put((mode, seed, stats, time.time() - start_time, index))
+
+    for sim in simulators.values():
+        sim.stop()
+
+
+class ScenarioScheduler:
+
+    # Run (mode, seed) tasks on n_workers persistent processes (os.cpu_count() by default).
+    # The tasks are dealt round-robin, longest first, to the worker queues; a worker that runs out of tasks steals from the
+    # others, so the cores running short 'low' episodes keep working while the 'high' ones finish.
+    # create_simulator(mode, max_steps, route_file) builds an event stepping Simulator inside the worker process.
+    def __init__(self, create_simulator, max_steps, n_workers=None):
+        self.n_workers = n_workers or os.cpu_count()
+        self.queues = [mp.Queue() for _ in range(self.n_workers)]
+        self.results = mp.Queue()
+        self.stop = mp.Event()
+        self.processes = []
+        for index in range(self.n_workers):
+            p = mp.Process(target=scheduler_worker, args=(index, create_simulator, max_steps, self.queues, self.results, self.stop))
+            self.processes.append(p)
+            p.start()
+
+    # Run every task, return [(mode, seed, stats, wall time, worker index)] in completion order.
+    # Raises WorkerError when a task fails in a worker, once the queues are empty again: the tasks no worker has started
+    # are taken back and the ones already running are waited for, so the next run does not read their results.
+    def run(self, tasks):
+        tasks = sorted(tasks, key=lambda task: MODE_VEHICLES.get(task[0], 0), reverse=True)
+        for i, task in enumerate(tasks):
+            self.queues[i % self.n_workers].put(task)
+        results = []
+        error = None
+        pending = len(tasks)
+        while pending > 0:
+            result = self.results.get()
+            pending -= 1
+            if not isinstance(result, WorkerError):
+                results.append(result)
+            elif error is None:
+                error = result
+                pending -= self._cancel()
+        if error is not None:
+            raise error
+        return results
+
+    # Remove the tasks still waiting in the worker queues, return how many
+    def _cancel(self):
+        cancelled = 0
+        for queue in self.queues:
+            while True:
+                try:
+                    queue.get_nowait()
+                except Empty:
+                    break
+                cancelled += 1
+        return cancelled
+
+    def close(self):
+        self.stop.set()
+        for p in self.processes:
+            p.join()
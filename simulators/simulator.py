@@ -177,7 +177,7 @@ class Simulator:
 
     # Check if the episode is finished (not very useful here, but often used in Reinforcement Learning tasks)
     def _is_done(self, step, max_steps):
-        return step < max_steps - 1
+        return step >= max_steps - 1
 
     # Run simulation (TraCI/SUMO)
     def run(self, gui=False, max_steps=100, batch_size=32):
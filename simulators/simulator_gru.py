@@ -2,9 +2,6 @@ import os
 import sys
 import requests
 from ast import literal_eval
-# This module exports a set of functions implemented in C corresponding to the intrinsic operators of Python. For example, operator.add(x, y) is equivalent to the expression x+y. The function names are those used for special methods; variants without leading and trailing '__' are also provided for convenience.
-import operator
-from functools import reduce
 import numpy as np
 import time
 
@@ -15,8 +12,9 @@ if 'SUMO_HOME' in os.environ:
 else:
     sys.exit("Please declare environment variable 'SUMO_HOME'")
 
-from sumolib import checkBinary  # Checks for the binary in environ vars
-import traci
+from simulators.connection import start_sumo
+from simulators.geometry import get_net_file
+from simulators.multi_junction import MultiJunctionCore
 import traci.constants as tc
 
 # Duration of green phase
@@ -24,113 +22,12 @@ GREEN_PHASE_DURATION = 21
 # Duration of yellow phase
 YELLOW_PHASE_DURATION = 6
 
-# phase codes based on xai_tlcs.net.xml
-PHASE_NS_GREEN = 0
-PHASE_NS_YELLOW = 1
-PHASE_NSL_GREEN = 2
-PHASE_NSL_YELLOW = 3
-PHASE_EW_GREEN = 4
-PHASE_EW_YELLOW = 5
-PHASE_EWL_GREEN = 6
-PHASE_EWL_YELLOW = 7
-
-
-def extract_waiting_time(vehicle):
-    # Return the waiting time only for the vehicle in queue
-    if vehicle[1][122] > 0.5:
-        return vehicle[1][122]
-    return 0
-
-
-def is_queued(vehicle):
-    return vehicle[1][122] > 0.5
-
-
-def compute_position_index(vehicle):
-    # Initialize vehicle_position_index as -1 in order to not taking into account vehicles driving away from the tls later
-    vehicle_position_index = -1
-    # Lane position
-    lane_pos = vehicle[1][86]
-    # Lane ID
-    lane_id = vehicle[1][81]
-    # Lanes are 750m long, this calculate the distance from the tls
-    distance_from_tls = 750 - lane_pos
-    # Lane group initialization
-    lane_group = -1
-    # In which lane is the car? _3 are the "turn left only" lanes
-    if '_3' in lane_id:
-        if lane_id == 'W2TL_3':
-            lane_group = 1
-        elif lane_id == 'N2TL_3':
-            lane_group = 3
-        elif lane_id == 'E2TL_3':
-            lane_group = 5
-        elif lane_id == 'S2TL_3':
-            lane_group = 7
-    else:
-        if 'W2TL' in lane_id:
-            lane_group = 0
-        elif 'N2TL' in lane_id:
-            lane_group = 2
-        elif 'E2TL' in lane_id:
-            lane_group = 4
-        elif 'S2TL' in lane_id:
-            lane_group = 6
-
-    if 0 <= lane_group <= 7:
-        # distance in meters from the TLS -> mapping into cells
-        if 400 <= distance_from_tls <= 750:
-            lane_cell = 9
-        elif 160 <= distance_from_tls < 400:
-            lane_cell = 8
-        elif 100 <= distance_from_tls < 160:
-            lane_cell = 7
-        elif 60 <= distance_from_tls < 100:
-            lane_cell = 6
-        elif 40 <= distance_from_tls < 60:
-            lane_cell = 5
-        elif 28 <= distance_from_tls < 40:
-            lane_cell = 4
-        elif 21 <= distance_from_tls < 28:
-            lane_cell = 3
-        elif 14 <= distance_from_tls < 21:
-            lane_cell = 2
-        elif 7 <= distance_from_tls < 14:
-            lane_cell = 1
-        elif distance_from_tls < 7:
-            lane_cell = 0
-        # composition of the two postion ID to create a number in the interval 0-79
-        vehicle_position_index = int(str(lane_group) + str(lane_cell))
-
-    return vehicle_position_index
-
-
-def compute_car_state(vehicle):
-    # Save the position of the vehicle as a point (vector) in a multi-dimensional space for faster computations
-    position = np.zeros(80)
-    # Save the speed of the vehicle as a point (vector) in a multi-dimensional space for faster computations
-    speed = np.zeros(80)
-    # Save the waiting_time of the vehicle as a point (vector) in a multi-dimensional space for faster computations
-    waiting_time = np.zeros(80)
-    # Save the queue_status of the vehicle as a point (vector) in a multi-dimensional space for faster computations
-    queue_status = np.zeros(80)
-
-    vehicle_position_index = compute_position_index(vehicle)
-
-    # Do not consider vehicles driving away from the tls
-    if vehicle_position_index > -1:
-        position[vehicle_position_index] = 1
-        speed[vehicle_position_index] = vehicle[1][64]
-        if vehicle[1][122] > 0.5:
-            queue_status[vehicle_position_index] = 1
-            waiting_time[vehicle_position_index] = vehicle[1][122]
-
-    return position, speed, waiting_time, queue_status
-
 
 class Simulator:
 
-    def __init__(self, label, sumocfg, state_size, max_steps, agent='ciao', gui=False):
+    # tls_ids: the traffic lights driven by the agent, each junction decides on its own states with the same agent
+    # (the junction shipped in environments/ by default)
+    def __init__(self, label, sumocfg, state_size, max_steps, agent='ciao', gui=False, observation='vehicle', backend=None, tls_ids=None):
         self.sumocfg = sumocfg
         self.state_size = state_size
         self.agent = agent
@@ -140,46 +37,37 @@ class Simulator:
         self.cumulative_waiting_time = 0
         self.throughput = 0
         self.cumulative_intersection_queue = 0
-        # tls state
-        self.yellow_phase = False
-        self.green_phase = False
-        self.yellow_phase_step_count = 0
-        self.green_phase_step_count = 0
-        # action
-        self.action = None
-        self.previous_action = None
+        # Decisions taken on an empty junction: no act call, no transition for the agent memory
+        self.idle_decisions = 0
+        self.idle_transitions = 0
 
         self.label = label
-        self.junction_id = 'TL'
-
-        # Control SUMO mode (with or without GUI)
-        if gui:
-            sumo_binary = checkBinary('sumo-gui')
-        else:
-            sumo_binary = checkBinary('sumo')
-
-        # Start SUMO with TraCI and some flags
-        traci.start([sumo_binary, "-c", self.sumocfg, "--no-step-log", "true"], label=self.label)
-
-        self.connection = traci.getConnection(self.label)
-
-        # The following code retrieves all vehicle speeds and waiting times within range (1000m) of a junction (the vehicle ids are retrieved implicitly). The values retrieved are always the ones from the last time step, it is not possible to retrieve older values.
-        # add tc.VAR_ACCUMULATED_WAITING_TIME, tc.VAR_POSITION if more than one tl
-        self.connection.junction.subscribeContext(self.junction_id, tc.CMD_GET_VEHICLE_VARIABLE, 1000, [tc.VAR_SPEED, tc.VAR_LANEPOSITION, tc.VAR_LANE_ID, tc.VAR_WAITING_TIME])
-        # VAR_LANEPOSITION = 86
-        # VAR_LANE_ID = 81
-        # VAR_WAITING_TIME = 122
-        # VAR_ARRIVED_VEHICLES_NUMBER = 121
-        # VAR_SPEED = 64
-
-        self.states = self._get_state(self.junction_id)
-
-    def _compute_current_waiting_time(self, junction_id):
-        subscription_results = self.connection.junction.getContextSubscriptionResults(junction_id)
-        if subscription_results is not None:
-            vehicles = subscription_results.items()
-            return reduce(operator.add, map(extract_waiting_time, vehicles))
-        return 0
+        self.tls_ids = list(tls_ids) if tls_ids is not None else ['TL']
+
+        # Start SUMO (its own process behind TraCI, or inside this process with libsumo) and some flags
+        self.connection = start_sumo(self.label, self.sumocfg, gui, backend)
+        # Number of vehicles arrived during the last step and current phase of every tls, delivered with the result of every
+        # simulationStep instead of one more call each: one TraCI round trip per step
+        self.connection.simulation.subscribe([tc.VAR_ARRIVED_VEHICLES_NUMBER])
+        for tls_id in self.tls_ids:
+            self.connection.trafficlight.subscribe(tls_id, [tc.TL_CURRENT_PHASE])
+
+        # Phases of every tls, and one observation per junction: on the incoming lanes ('vehicle') or within 1000m of the junction ('junction'), one state cell per lane section, or the incoming lanes aggregates ('lane', one state cell per lane group)
+        # (lanes approaching each junction and their cells read from the net file, cached on disk)
+        self.core = MultiJunctionCore(self.connection, self.tls_ids, get_net_file(self.sumocfg), observation, GREEN_PHASE_DURATION, YELLOW_PHASE_DURATION)
+        # The agent network is sized for state_size: the cells of the observation and the tls phase
+        if self.core.state_size + 1 != self.state_size:
+            raise ValueError("state_size {} does not match the '{}' observation, expected {}".format(self.state_size, observation, self.core.state_size + 1))
+
+        snapshots = [self._take_snapshot(index) for index in range(len(self.tls_ids))]
+        # Per junction: last (up to 4) states at the decision points
+        self.states = [self._get_state(index, snapshot).reshape(1, -1) for index, snapshot in enumerate(snapshots)]
+        # No vehicle on the incoming lanes of the junction at its last decision point
+        self.idle = np.array([snapshot.empty for snapshot in snapshots])
+
+    # Parse the subscription results of a junction for the last simulation step once, state, waiting time and queue are all read from it
+    def _take_snapshot(self, index):
+        return self.core.observations[index].take_snapshot()
 
     def _compute_reward(self, current_waiting_time, current_queue, step):
         reward = 1
@@ -211,141 +99,83 @@ class Simulator:
     #         return 1 / current_waiting_time
     #     return 1
 
-    def _compute_throughput(self):
-        return self.connection.simulation.getArrivedNumber()
-
-    def _compute_queue(self, junction_id):
-        subscription_results = self.connection.junction.getContextSubscriptionResults(junction_id)
-        queue = 0
-        if subscription_results is not None:
-            vehicles = subscription_results.items()
-            queue = reduce(operator.add, map(is_queued, vehicles))
-        return queue
-
-    def _get_state(self, junction_id):
-        subscription_results = self.connection.junction.getContextSubscriptionResults(junction_id)
+    def _get_state(self, index, snapshot):
         state = np.zeros(self.state_size)
 
-        if subscription_results is not None:
-            vehicles = subscription_results.items()
-            # Filter out all the vehicles that are driving away from TLS
-            vehicles = list(filter(lambda x: '2TL' in x[1][81], vehicles))
-
-            cars_per_cell = np.zeros(80)
-            avarage_speed_per_cell = np.zeros(80)
-            cumulated_waiting_time_per_cell = np.zeros(80)
-            queue_per_cell = np.zeros(80)
-
-            if len(vehicles) > 0:
-                positions, speeds, waiting_times, queue_statuses = zip(*map(compute_car_state, vehicles))
-
-                # number of cars per cell going to the tls
-                cars_per_cell = reduce(np.add, positions)
-                # avarage speed per cell / ignore divide by zero warnings
-                with np.errstate(divide='ignore', invalid='ignore'):
-                    avarage_speed_per_cell = np.nan_to_num(np.divide(reduce(np.add, speeds), cars_per_cell))
-                # cumulated waiting time per cell
-                cumulated_waiting_time_per_cell = reduce(np.add, waiting_times)
-                # number of cars queued per cell
-                queue_per_cell = reduce(np.add, queue_statuses)
+        # No vehicle: every cell is 0, only the tls phase is left
+        if snapshot.empty:
+            if snapshot.has_results:
+                state[-1] = self.connection.trafficlight.getSubscriptionResults(self.tls_ids[index])[tc.TL_CURRENT_PHASE]
+            return state
 
-            # tls phase
-            tls_phase = np.array([self.connection.trafficlight.getPhase("TL")])
+        if snapshot.has_results:
+            # number of cars, avarage speed, cumulated waiting time and number of cars queued per cell going to the tls
+            # (junctions with fewer approaches leave the cells before the tls phase to 0)
+            cells = np.concatenate(snapshot.cell_state())
+            state[:len(cells)] = cells
 
-            state = np.concatenate([cars_per_cell, avarage_speed_per_cell, cumulated_waiting_time_per_cell, queue_per_cell, tls_phase])
+            # tls phase
+            state[-1] = self.connection.trafficlight.getSubscriptionResults(self.tls_ids[index])[tc.TL_CURRENT_PHASE]
 
         return state
 
     # Check if the episode is finished (not very useful here, but often used in Reinforcement Learning tasks)
     def _is_done(self, step):
-        return step < self.max_steps - 1
+        return step >= self.max_steps - 1
+
+    # One action per history of states: /act for a single junction, /act_batch for several
+    def _act(self, states):
+        if len(states) == 1:
+            return [requests.post('http://127.0.0.1:5000/act', json={'states': states[0].tolist()}).json()['action']]
+        return requests.post('http://127.0.0.1:5000/act_batch', json={'states': [state.tolist() for state in states]}).json()['actions']
 
     def do_step(self, step):
-        # Choose self.action and (start yellow phase or execute self.action)
-        if not self.green_phase and not self.yellow_phase:
-            # Let the agent choose action
-            # Store previous action
-            self.previous_action = self.action
-            # Choose action
-            if (self.states.shape[0] == 321):
-                self.states = self.states.reshape(1, 321)
-            self.action = requests.post('http://127.0.0.1:5000/act', json={'states': self.states.tolist()}).json()['action']
-            # Start yellow phase
-            if self.action != self.previous_action and self.previous_action is not None:
-                self.yellow_phase = True
-                # print('start yellow phase')
-                # yellow phase based on previous action
-                if self.previous_action == 0:
-                    self.connection.trafficlight.setPhase("TL", PHASE_NS_YELLOW)
-                elif self.previous_action == 1:
-                    self.connection.trafficlight.setPhase("TL", PHASE_NSL_YELLOW)
-                elif self.previous_action == 2:
-                    self.connection.trafficlight.setPhase("TL", PHASE_EW_YELLOW)
-                elif self.previous_action == 3:
-                    self.connection.trafficlight.setPhase("TL", PHASE_EWL_YELLOW)
-
-            # Execute action
-            else:
-                # print('start green phase')
-                self.green_phase = True
-                if self.action == 0:
-                    self.connection.trafficlight.setPhase("TL", PHASE_NS_GREEN)
-                elif self.action == 1:
-                    self.connection.trafficlight.setPhase("TL", PHASE_NSL_GREEN)
-                elif self.action == 2:
-                    self.connection.trafficlight.setPhase("TL", PHASE_EW_GREEN)
-                elif self.action == 3:
-                    self.connection.trafficlight.setPhase("TL", PHASE_EWL_GREEN)
-
-        # Do step
-        self.connection.simulationStep(float(step))
-
-        # Update yellow phase counter
-        if self.yellow_phase:
-            # print('update yellow phase counter')
-            self.yellow_phase_step_count += 1
-            # Reset yellow phase
-            if self.yellow_phase_step_count == YELLOW_PHASE_DURATION:
-                # print('reset yellow phase count')
-                self.yellow_phase = False
-                self.yellow_phase_step_count = 0
-        # Update green phase counter
-        elif self.green_phase:
-            # print('update green phase counter')
-            self.green_phase_step_count += 1
-            # Reset green phase
-            if self.green_phase_step_count == GREEN_PHASE_DURATION:
-                # print('reset green phase count')
-                self.green_phase = False
-                self.green_phase_step_count = 0
-            # elif self.green_phase_step_count == 1:
-                # print('do things')
-                current_queue = self._compute_queue(self.junction_id)
-                current_waiting_time = self._compute_current_waiting_time(self.junction_id)
-                reward = self._compute_reward(current_waiting_time, current_queue, step)
-                done = self._is_done(step)
-                next_state = self._get_state(self.junction_id)
-                next_states = np.vstack((self.states, next_state))
-                if len(next_states) > 4:
-                    # Delete first element
-                    next_states = np.delete(next_states, 0, 0)
-                # Feed agent memory
-                if len(self.states) == 4:
-                    requests.post('http://127.0.0.1:5000/remember', json={
-                        'state': self.states.tolist(),
-                        'action': self.action,
-                        'reward': reward,
-                        'next_state': next_states.tolist(),
-                        'done': done
-                    })
-
-                # Update
-                self.states = next_states
-                self.cumulative_reward += reward
-                self.cumulative_waiting_time += current_waiting_time
-                self.cumulative_intersection_queue += current_queue
-
-        self.throughput += self._compute_throughput()
+        # Let the agent choose the action of every deciding junction and (start yellow phase or execute the action)
+        deciding = self.core.deciding()
+        if deciding.any():
+            asking = deciding & ~self.idle
+            # Nothing to decide on an empty junction, the green phase goes on (the first one is action 0)
+            actions = np.where(self.core.actions > -1, self.core.actions, 0)
+            if asking.any():
+                actions[asking] = self._act([self.states[index] for index in np.flatnonzero(asking).tolist()])
+            self.idle_decisions += int(np.count_nonzero(deciding & self.idle))
+            self.core.set_actions(actions)
+
+        # Do step, the tls timers follow (green phase after the yellow one)
+        ended = self.core.step(step)
+
+        # Reward the actions at the end of their green phase, one transition per junction
+        for index in np.flatnonzero(ended).tolist():
+            snapshot = self._take_snapshot(index)
+            current_queue = snapshot.queue
+            current_waiting_time = snapshot.waiting_time
+            reward = self._compute_reward(current_waiting_time, current_queue, step)
+            done = self._is_done(step)
+            next_state = self._get_state(index, snapshot)
+            next_states = np.vstack((self.states[index], next_state))
+            if len(next_states) > 4:
+                # Delete first element
+                next_states = np.delete(next_states, 0, 0)
+            # Feed agent memory, unless the agent did not choose the action
+            if self.idle[index]:
+                self.idle_transitions += 1
+            elif len(self.states[index]) == 4:
+                requests.post('http://127.0.0.1:5000/remember', json={
+                    'state': self.states[index].tolist(),
+                    'action': int(self.core.actions[index]),
+                    'reward': reward,
+                    'next_state': next_states.tolist(),
+                    'done': done
+                })
+
+            # Update
+            self.states[index] = next_states
+            self.idle[index] = snapshot.empty
+            self.cumulative_reward += reward
+            self.cumulative_waiting_time += current_waiting_time
+            self.cumulative_intersection_queue += current_queue
+
+        self.throughput += self.connection.simulation.getSubscriptionResults()[tc.VAR_ARRIVED_VEHICLES_NUMBER]
 
     # end simulation
     def stop(self):
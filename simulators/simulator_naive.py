@@ -15,8 +15,9 @@ if 'SUMO_HOME' in os.environ:
 else:
     sys.exit("Please declare environment variable 'SUMO_HOME'")
 
-from sumolib import checkBinary  # Checks for the binary in environ vars
-import traci
+from simulators.connection import start_sumo
+from simulators.geometry import get_net_file
+from simulators.multi_junction import MultiJunctionCore
 import traci.constants as tc
 
 # Duration of green phase
@@ -24,16 +25,6 @@ GREEN_PHASE_DURATION = 31
 # Duration of yellow phase
 YELLOW_PHASE_DURATION = 6
 
-# phase codes based on xai_tlcs.net.xml
-PHASE_NS_GREEN = 0
-PHASE_NS_YELLOW = 1
-PHASE_NSL_GREEN = 2
-PHASE_NSL_YELLOW = 3
-PHASE_EW_GREEN = 4
-PHASE_EW_YELLOW = 5
-PHASE_EWL_GREEN = 6
-PHASE_EWL_YELLOW = 7
-
 
 def extract_waiting_time(vehicle):
     # Return the waiting time only for the vehicle in queue
@@ -48,7 +39,8 @@ def is_queued(vehicle):
 
 class Simulator:
 
-    def __init__(self, label, sumocfg, max_steps, green_phase_duration=31, gui=False):
+    # tls_ids: the traffic lights cycled through their actions (the junction shipped in environments/ by default)
+    def __init__(self, label, sumocfg, max_steps, green_phase_duration=31, gui=False, backend=None, tls_ids=None):
         self.sumocfg = sumocfg
         self.max_steps = max_steps
         self.green_phase_duration = green_phase_duration
@@ -57,33 +49,25 @@ class Simulator:
         self.cumulative_waiting_time = 0
         self.throughput = 0
         self.cumulative_intersection_queue = 0
-        # tls state
-        self.yellow_phase = False
-        self.green_phase = False
-        self.yellow_phase_step_count = 0
-        self.green_phase_step_count = 0
-        # action
-        self.action = None
-        self.previous_action = None
 
         self.label = label
-        self.junction_id = 'TL'
-        self.current_waiting_time = 0
-
-        # Control SUMO mode (with or without GUI)
-        if gui:
-            sumo_binary = checkBinary('sumo-gui')
-        else:
-            sumo_binary = checkBinary('sumo')
-
-        # Start SUMO with TraCI and some flags
-        traci.start([sumo_binary, "-c", self.sumocfg, "--no-step-log", "true"], label=self.label)
-
-        self.connection = traci.getConnection(self.label)
-
-        # The following code retrieves all vehicle speeds and waiting times within range (1000m) of a junction (the vehicle ids are retrieved implicitly). The values retrieved are always the ones from the last time step, it is not possible to retrieve older values.
-        # add tc.VAR_ACCUMULATED_WAITING_TIME, tc.VAR_POSITION if more than one tl
-        self.connection.junction.subscribeContext(self.junction_id, tc.CMD_GET_VEHICLE_VARIABLE, 1000, [tc.VAR_SPEED, tc.VAR_LANEPOSITION, tc.VAR_LANE_ID, tc.VAR_WAITING_TIME])
+        self.tls_ids = list(tls_ids) if tls_ids is not None else ['TL']
+        # Waiting time of every junction at the last step
+        self.current_waiting_times = [0] * len(self.tls_ids)
+
+        # Start SUMO (its own process behind TraCI, or inside this process with libsumo) and some flags
+        # Every vehicle is loaded up front, so the vehicles still expected are exactly the ones not arrived yet
+        self.connection = start_sumo(self.label, self.sumocfg, gui, backend, ['--route-steps', '0'])
+        # Number of vehicles still expected and arrived during the last step, delivered with the result of every simulationStep
+        # instead of one more call each: one TraCI round trip per step
+        self.connection.simulation.subscribe([tc.VAR_MIN_EXPECTED_VEHICLES, tc.VAR_ARRIVED_VEHICLES_NUMBER])
+        # Simulated seconds not run because the network had drained
+        self.skipped_steps = 0
+
+        # Phases of every tls. Its 'junction' observation retrieves all vehicle speeds and waiting times within range (1000m)
+        # of each junction (the vehicle ids are retrieved implicitly), the stats below read these context subscriptions.
+        # The values retrieved are always the ones from the last time step, it is not possible to retrieve older values.
+        self.core = MultiJunctionCore(self.connection, self.tls_ids, get_net_file(self.sumocfg), 'junction', self.green_phase_duration, YELLOW_PHASE_DURATION)
         # VAR_LANEPOSITION = 86
         # VAR_LANE_ID = 81
         # VAR_WAITING_TIME = 122
@@ -101,7 +85,7 @@ class Simulator:
         return previous_waiting_time - current_waiting_time
 
     def _compute_throughput(self):
-        return self.connection.simulation.getArrivedNumber()
+        return self.connection.simulation.getSubscriptionResults()[tc.VAR_ARRIVED_VEHICLES_NUMBER]
 
     def _compute_queue(self, junction_id):
         subscription_results = self.connection.junction.getContextSubscriptionResults(junction_id)
@@ -112,86 +96,25 @@ class Simulator:
         return queue
 
     def do_step(self, step):
-        # Choose self.action and (start yellow phase or execute self.action)
-        if (not self.green_phase and not self.yellow_phase):
-            # Let the agent choose action
-            # Store previous action
-            self.previous_action = self.action
-            # Choose action
-            if self.previous_action in [0, 1, 2]:
-                self.action = self.previous_action + 1
-            # elif self.previous_action == 3:
-            #     self.action = 0
-            else:
-                self.action = 0
-
-            # Start yellow phase
-            if self.action != self.previous_action and self.previous_action is not None:
-                self.yellow_phase = True
-                # print('start yellow phase')
-                # yellow phase based on previous action
-                if self.previous_action == 0:
-                    self.connection.trafficlight.setPhase('TL', PHASE_NS_YELLOW)
-                elif self.previous_action == 1:
-                    self.connection.trafficlight.setPhase('TL', PHASE_NSL_YELLOW)
-                elif self.previous_action == 2:
-                    self.connection.trafficlight.setPhase('TL', PHASE_EW_YELLOW)
-                elif self.previous_action == 3:
-                    self.connection.trafficlight.setPhase('TL', PHASE_EWL_YELLOW)
-            # Continue green phase
-            else:
-                self.green_phase = True
-                if self.action == 0:
-                    self.connection.trafficlight.setPhase("TL", PHASE_NS_GREEN)
-                elif self.action == 1:
-                    self.connection.trafficlight.setPhase("TL", PHASE_NSL_GREEN)
-                elif self.action == 2:
-                    self.connection.trafficlight.setPhase("TL", PHASE_EW_GREEN)
-                elif self.action == 3:
-                    self.connection.trafficlight.setPhase("TL", PHASE_EWL_GREEN)
-
-        # Do step
-        self.connection.simulationStep(float(step))
-
-        # Update yellow phase counter
-        if self.yellow_phase:
-            # print('update yellow phase counter')
-            self.yellow_phase_step_count += 1
-            # Reset yellow phase
-            if self.yellow_phase_step_count == YELLOW_PHASE_DURATION:
-                # print('reset yellow phase count')
-                self.yellow_phase = False
-                self.yellow_phase_step_count = 0
-                # Start green phase
-                self.green_phase = True
-                if self.action == 0:
-                    self.connection.trafficlight.setPhase("TL", PHASE_NS_GREEN)
-                elif self.action == 1:
-                    self.connection.trafficlight.setPhase("TL", PHASE_NSL_GREEN)
-                elif self.action == 2:
-                    self.connection.trafficlight.setPhase("TL", PHASE_EW_GREEN)
-                elif self.action == 3:
-                    self.connection.trafficlight.setPhase("TL", PHASE_EWL_GREEN)
-        # Update green phase counter
-        elif self.green_phase:
-            # print('update green phase counter')
-            self.green_phase_step_count += 1
-            # Reset green phase
-            if self.green_phase_step_count == self.green_phase_duration:
-                # print('reset green phase count')
-                self.green_phase = False
-                self.green_phase_step_count = 0
+        # Choose the action of every deciding junction and (start yellow phase or execute the action)
+        if self.core.deciding().any():
+            # Choose action: the next one of the tls program, the first one to start with
+            self.core.set_actions((self.core.actions + 1) % self.core.action_sizes)
+
+        # Do step, the tls timers follow (green phase after the yellow one)
+        self.core.step(step)
 
         # Compute stats
-        current_queue = self._compute_queue(self.junction_id)
-        previous_waiting_time = self.current_waiting_time
-        self.current_waiting_time = self._compute_current_waiting_time(self.junction_id)
-        reward = self._compute_reward(self.current_waiting_time, previous_waiting_time, step)
+        for index, tls_id in enumerate(self.tls_ids):
+            current_queue = self._compute_queue(tls_id)
+            previous_waiting_time = self.current_waiting_times[index]
+            self.current_waiting_times[index] = self._compute_current_waiting_time(tls_id)
+            reward = self._compute_reward(self.current_waiting_times[index], previous_waiting_time, step)
 
-        # Update
-        self.cumulative_reward += reward
-        self.cumulative_waiting_time += self.current_waiting_time
-        self.cumulative_intersection_queue += current_queue
+            # Update
+            self.cumulative_reward += reward
+            self.cumulative_waiting_time += self.current_waiting_times[index]
+            self.cumulative_intersection_queue += current_queue
 
         self.throughput += self._compute_throughput()
 
@@ -205,7 +128,16 @@ class Simulator:
 
         return self.cumulative_reward, avg_waiting_time, avg_intersection_queue, self.throughput
 
+    # Nothing left to drive: no vehicle in the network and none to come
+    def _drained(self):
+        return self.connection.simulation.getSubscriptionResults()[tc.VAR_MIN_EXPECTED_VEHICLES] == 0
+
     def run(self, max_steps):
         for step in range(0, max_steps):
+            # Every next step would add no waiting time, no queue and no reward: the averages over max_steps are the same.
+            # Checked between two phases of every junction only, so the green phase the last vehicle left in gets its reward first.
+            if self.core.deciding().all() and step > 0 and self._drained():
+                self.skipped_steps = max_steps - step
+                break
             self.do_step(step)
         return self.stop()
@@ -0,0 +1,82 @@
+import numpy as np
+from simulators.geometry import DEFAULT_GEOMETRY
+from simulators.state_encoder import QUEUE_WAITING_TIME_THRESHOLD, encode_vehicles, compute_cell_state
+
+
+class StepSnapshot:
+
+    # Wrap the junction context subscription results of one simulation step.
+    # The vehicles are parsed into arrays only once, the first time state, waiting time or queue are needed,
+    # so building a snapshot on every step costs nothing on the steps where the agent does not decide.
+    # With a VehicleBuffer the vehicles are written into its preallocated columns instead of new arrays.
+    def __init__(self, subscription_results, arrived_number=0, geometry=DEFAULT_GEOMETRY, buffer=None):
+        self.subscription_results = subscription_results
+        self.geometry = geometry
+        self.buffer = buffer
+        # Number of vehicles that reached their destination during the step
+        self.arrived_number = arrived_number
+        self._cell_indexes = None
+        self._speeds = None
+        self._waiting_times = None
+
+    @property
+    def has_results(self):
+        return self.subscription_results is not None
+
+    # No vehicle subscribed: all-zero state, no waiting time, no queue
+    @property
+    def empty(self):
+        return not self.subscription_results
+
+    def _parse(self):
+        if self._cell_indexes is None:
+            if self.buffer is not None:
+                self.buffer.fill(self.subscription_results)
+                size = self.buffer.size
+                self._cell_indexes, self._speeds, self._waiting_times = self.buffer.cell_indexes[:size], self.buffer.speeds[:size], self.buffer.waiting_times[:size]
+            else:
+                vehicles = self.subscription_results.items() if self.has_results else []
+                self._cell_indexes, self._speeds, self._waiting_times = encode_vehicles(vehicles, self.geometry)
+
+    @property
+    def cell_indexes(self):
+        self._parse()
+        return self._cell_indexes
+
+    @property
+    def speeds(self):
+        self._parse()
+        return self._speeds
+
+    @property
+    def waiting_times(self):
+        self._parse()
+        return self._waiting_times
+
+    @property
+    def queued(self):
+        return self.waiting_times > QUEUE_WAITING_TIME_THRESHOLD
+
+    # Cumulated waiting time of the vehicles in queue
+    @property
+    def waiting_time(self):
+        if self.buffer is not None:
+            self._parse()
+            return self.buffer.waiting_time()
+        # Sum in subscription order, as the previous reduce(operator.add, ...) did
+        return sum(self.waiting_times[self.queued].tolist())
+
+    # Number of vehicles in queue
+    @property
+    def queue(self):
+        if self.buffer is not None:
+            self._parse()
+            return self.buffer.queue()
+        return int(np.count_nonzero(self.queued))
+
+    # Number of cars, average speed, cumulated waiting time and number of cars queued per cell going to the tls
+    def cell_state(self):
+        if self.buffer is not None:
+            self._parse()
+            return self.buffer.cell_state()
+        return compute_cell_state(self.cell_indexes, self.speeds, self.waiting_times, self.geometry.number_of_cells)
@@ -0,0 +1,46 @@
+import os
+import hashlib
+from simulators.demand import get_route_files
+from simulators.geometry import get_net_file
+
+# Saved SUMO states are stored here, one file per (configuration, network, route files content, SUMO options, warm-up time)
+STATE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.state_cache')
+
+
+class StateCache:
+
+    # Warm start episodes: the network state at the end of the warm-up is saved once (SUMO saveState)
+    # and loaded by every later episode with the same demand (SUMO loadState) instead of being simulated again.
+    # The demand is identified by the content of its route files, so a regenerated route file with the same
+    # (mode, seed) hits the cache and a different one does not. The configuration and net file contents and the
+    # SUMO options are part of the key too: an edited network or configuration never loads a stale state.
+    def __init__(self, cache_dir=STATE_CACHE_DIR):
+        self.cache_dir = cache_dir
+        # Warm starts served from the cache and simulated
+        self.hits = 0
+        self.misses = 0
+
+    def state_file(self, sumocfg, route_files, warmup_time, options=()):
+        key = hashlib.sha1(os.path.abspath(sumocfg).encode())
+        key.update(' '.join(options).encode())
+        for input_file in [sumocfg, get_net_file(sumocfg)] + get_route_files(sumocfg, route_files):
+            with open(input_file, 'rb') as f:
+                key.update(f.read())
+        return os.path.join(self.cache_dir, key.hexdigest() + '-' + str(warmup_time) + '.xml')
+
+    # Bring the simulation freshly started (or loaded) on the connection to warmup_time.
+    # route_files: the route files overriding the ones of the configuration, if any, options: the SUMO options the simulation was started with
+    def warm_start(self, connection, sumocfg, warmup_time, route_files=None, options=()):
+        state_file = self.state_file(sumocfg, route_files, warmup_time, options)
+        if os.path.isfile(state_file):
+            connection.simulation.loadState(state_file)
+            self.hits += 1
+            return
+        # Simulate the warm-up with the tls program of the network, as the episodes start
+        connection.simulationStep(float(warmup_time))
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Several simulators may warm up the same demand at the same time, write aside and rename so nobody loads a partial file
+        temporary_file = state_file + '.' + str(os.getpid()) + '.xml'
+        connection.simulation.saveState(temporary_file)
+        os.replace(temporary_file, state_file)
+        self.misses += 1
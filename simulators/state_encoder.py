@@ -0,0 +1,70 @@
+import numpy as np
+from simulators.geometry import DEFAULT_GEOMETRY
+
+# A vehicle is considered queued when it has been waiting more than this (seconds)
+QUEUE_WAITING_TIME_THRESHOLD = 0.5
+
+# Subscription variable codes
+# VAR_SPEED = 64
+# VAR_LANE_ID = 81
+# VAR_LANEPOSITION = 86
+# VAR_WAITING_TIME = 122
+
+
+def compute_cell_indexes(lane_indexes, lane_positions, geometry=DEFAULT_GEOMETRY):
+    # -1 for vehicles not approaching the tls
+    approaching = lane_indexes > -1
+    lane_indexes = np.where(approaching, lane_indexes, 0)
+    # Distance from the tls
+    distances_from_tls = geometry.lane_lengths[lane_indexes] - lane_positions
+    # distance in meters from the TLS -> mapping into cells
+    lane_cells = np.searchsorted(geometry.cell_boundaries, distances_from_tls, side='right')
+    # composition of the two postion ID to create a number in the interval 0-79
+    return np.where(approaching, geometry.lane_groups[lane_indexes] * geometry.cells_per_lane_group + lane_cells, -1)
+
+
+def encode_vehicles(vehicles, geometry=DEFAULT_GEOMETRY):
+    # Turn the (vehicle_id, variables) pairs of a subscription into cell indexes, speeds and waiting times
+    vehicles = list(vehicles)
+    count = len(vehicles)
+    lane_indexes = np.fromiter((geometry.lane_indexes.get(vehicle[1][81], -1) for vehicle in vehicles), dtype=np.int64, count=count)
+    lane_positions = np.fromiter((vehicle[1][86] for vehicle in vehicles), dtype=np.float64, count=count)
+    cell_indexes = compute_cell_indexes(lane_indexes, lane_positions, geometry)
+    speeds = np.fromiter((vehicle[1][64] for vehicle in vehicles), dtype=np.float64, count=count)
+    waiting_times = np.fromiter((vehicle[1][122] for vehicle in vehicles), dtype=np.float64, count=count)
+    return cell_indexes, speeds, waiting_times
+
+
+def compute_cell_state(cell_indexes, speeds, waiting_times, number_of_cells=DEFAULT_GEOMETRY.number_of_cells):
+    # Do not consider vehicles driving away from the tls
+    in_cells = cell_indexes > -1
+    cell_indexes = cell_indexes[in_cells]
+    speeds = speeds[in_cells]
+    waiting_times = waiting_times[in_cells]
+    # Only queued vehicles contribute to the waiting time and to the queue
+    queued = waiting_times > QUEUE_WAITING_TIME_THRESHOLD
+
+    # number of cars per cell going to the tls
+    cars_per_cell = np.bincount(cell_indexes, minlength=number_of_cells).astype(np.float64)
+    # average speed per cell / ignore divide by zero warnings
+    with np.errstate(divide='ignore', invalid='ignore'):
+        average_speed_per_cell = np.nan_to_num(np.divide(np.bincount(cell_indexes, weights=speeds, minlength=number_of_cells), cars_per_cell))
+    # cumulated waiting time per cell
+    cumulated_waiting_time_per_cell = np.bincount(cell_indexes[queued], weights=waiting_times[queued], minlength=number_of_cells)
+    # number of cars queued per cell
+    queue_per_cell = np.bincount(cell_indexes[queued], minlength=number_of_cells).astype(np.float64)
+
+    return cars_per_cell, average_speed_per_cell, cumulated_waiting_time_per_cell, queue_per_cell
+
+
+# State of a junction as the feed-forward simulators build it, written into out (4 * number_of_cells values):
+# shares of the cars, waiting time and queue per cell, average speed per cell over 26 m/s
+def normalize_cell_state(cars_per_cell, average_speed_per_cell, cumulated_waiting_time_per_cell, queue_per_cell, out):
+    number_of_cells = len(cars_per_cell)
+    for index, values in enumerate([cars_per_cell, average_speed_per_cell, cumulated_waiting_time_per_cell, queue_per_cell]):
+        total = 26 if index == 1 else values.sum()
+        if total > 0:
+            np.divide(values, total, out=out[index * number_of_cells:(index + 1) * number_of_cells])
+        else:
+            out[index * number_of_cells:(index + 1) * number_of_cells] = 0
+    return out
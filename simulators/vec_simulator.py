@@ -0,0 +1,64 @@
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+
+class VecSimulator:
+
+    # Drive several simulators (event stepping) in lockstep, one decision tick at a time:
+    # the states of every junction waiting for a decision, in every simulator, go to the agent in a single /act_batch call,
+    # then each simulator runs the actions it got up to its own next decision point.
+    # The agent predicts on one (n_decisions, state_size) batch instead of n_decisions batches of one.
+    # As in AsyncRunner, the decisions of a tick (do_decision) run in a thread per simulator: the socket waits of the TraCI
+    # calls release the GIL, so all the SUMO instances step concurrently and a tick lasts as long as its slowest simulator.
+    def __init__(self, simulators, act_url='http://127.0.0.1:5000/act_batch'):
+        for sim in simulators:
+            if sim.stepping != 'event':
+                raise ValueError("VecSimulator needs simulators created with stepping='event'")
+        self.simulators = list(simulators)
+        self.act_url = act_url
+        self.executor = ThreadPoolExecutor(max_workers=len(self.simulators))
+        # Number of /act_batch calls and of actions they returned in the last episode
+        self.ticks = 0
+        self.decisions = 0
+
+    def __len__(self):
+        return len(self.simulators)
+
+    # One action per state, in order
+    def act(self, states):
+        return requests.post(self.act_url, json={'states': [state.tolist() for state in states]}).json()['actions']
+
+    # Run one episode in every simulator, return the stats of each one
+    def run_episode(self, max_steps):
+        steps = [sim.start_step for sim in self.simulators]
+        self.ticks = 0
+        self.decisions = 0
+        while True:
+            waiting = [i for i, step in enumerate(steps) if step < max_steps]
+            if not waiting:
+                break
+            # The empty junctions choose their action themselves, they have no decision state
+            decision_states = [self.simulators[i].decision_states() for i in waiting]
+            batch = [state for states in decision_states for state in states]
+            batch_actions = self.act(batch) if batch else []
+            # Split the actions back, one list per simulator
+            actions = {}
+            offset = 0
+            for i, states in zip(waiting, decision_states):
+                actions[i] = batch_actions[offset:offset + len(states)]
+                offset += len(states)
+            next_steps = self.executor.map(lambda i: self.simulators[i].do_decision(steps[i], actions[i]), waiting)
+            for i, step in zip(waiting, list(next_steps)):
+                steps[i] = step
+            self.ticks += 1
+            self.decisions += len(batch)
+        return [sim.stats() for sim in self.simulators]
+
+    # Next episode in every simulator, in the same SUMO processes, reloaded concurrently
+    def reset(self):
+        list(self.executor.map(lambda sim: sim.reset(), self.simulators))
+
+    def stop(self):
+        stats = [sim.stop() for sim in self.simulators]
+        self.executor.shutdown()
+        return stats
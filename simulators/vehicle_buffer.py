@@ -0,0 +1,116 @@
+import numpy as np
+from simulators.geometry import DEFAULT_GEOMETRY
+from simulators.state_encoder import QUEUE_WAITING_TIME_THRESHOLD
+
+
+class VehicleBuffer:
+
+    # Columnar storage for the vehicles of one subscription, reused step after step.
+    # The columns only grow (doubling) when more vehicles than ever before are subscribed,
+    # so in steady state filling the buffer and computing the cell state allocate nothing per vehicle.
+    # The arrays are overwritten by the next fill: read them before taking the next snapshot.
+    def __init__(self, geometry=DEFAULT_GEOMETRY, capacity=1024):
+        self.geometry = geometry
+        self.size = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self.capacity = capacity
+        # Subscribed variables
+        self.speeds = np.zeros(capacity, dtype=np.float32)
+        self.lane_positions = np.zeros(capacity, dtype=np.float32)
+        self.waiting_times = np.zeros(capacity, dtype=np.float32)
+        # Position of the lane in the geometry lane arrays, -1 for lanes not approaching the tls
+        self.lane_codes = np.zeros(capacity, dtype=np.int16)
+        # Cell of the vehicle, -1 for vehicles not approaching the tls
+        self.cell_indexes = np.zeros(capacity, dtype=np.int16)
+        # Work arrays: np.bincount wants intp indexes and float64 weights, anything else would be copied on every call
+        self._bins = np.zeros(capacity, dtype=np.intp)
+        self._lanes = np.zeros(capacity, dtype=np.intp)
+        self._weights = np.zeros(capacity, dtype=np.float64)
+        self._flags = np.zeros(capacity, dtype=bool)
+        self._passed = np.zeros(capacity, dtype=bool)
+
+    def fill(self, subscription_results):
+        count = len(subscription_results) if subscription_results is not None else 0
+        if count > self.capacity:
+            self._allocate(max(count, 2 * self.capacity))
+        self.size = count
+        if count == 0:
+            return
+
+        lane_indexes = self.geometry.lane_indexes
+        speeds = self.speeds
+        lane_positions = self.lane_positions
+        waiting_times = self.waiting_times
+        lane_codes = self.lane_codes
+        for i, variables in enumerate(subscription_results.values()):
+            speeds[i] = variables[64]
+            lane_positions[i] = variables[86]
+            waiting_times[i] = variables[122]
+            lane_codes[i] = lane_indexes.get(variables[81], -1)
+
+        self._compute_cell_indexes()
+
+    def _compute_cell_indexes(self):
+        size = self.size
+        geometry = self.geometry
+        lanes = self._lanes[:size]
+        bins = self._bins[:size]
+        distances_from_tls = self._weights[:size]
+        not_approaching = self._flags[:size]
+        passed = self._passed[:size]
+
+        np.less(self.lane_codes[:size], 0, out=not_approaching)
+        np.maximum(self.lane_codes[:size], 0, out=lanes)
+        # Distance from the tls
+        np.take(geometry.lane_lengths, lanes, out=distances_from_tls, mode='clip')
+        np.subtract(distances_from_tls, self.lane_positions[:size], out=distances_from_tls)
+        # distance in meters from the TLS -> mapping into cells: count the cell boundaries already passed
+        bins.fill(0)
+        for boundary in geometry.cell_boundaries:
+            np.add(bins, np.greater_equal(distances_from_tls, boundary, out=passed), out=bins)
+        # mode='clip' is not buffered, unlike the default mode='raise' (the lanes are valid indexes anyway)
+        np.take(geometry.lane_groups, lanes, out=lanes, mode='clip')
+        np.multiply(lanes, geometry.cells_per_lane_group, out=lanes)
+        np.add(bins, lanes, out=bins)
+        # Vehicles not approaching the tls are counted in an extra cell which is dropped at the end
+        np.copyto(bins, geometry.number_of_cells, where=not_approaching)
+
+        np.copyto(self.cell_indexes[:size], bins, casting='unsafe')
+        np.copyto(self.cell_indexes[:size], -1, where=not_approaching)
+
+    def _queued(self):
+        return np.greater(self.waiting_times[:self.size], QUEUE_WAITING_TIME_THRESHOLD, out=self._flags[:self.size])
+
+    # Cumulated waiting time of the vehicles in queue
+    def waiting_time(self):
+        queued_waiting_times = self._weights[:self.size]
+        np.multiply(self.waiting_times[:self.size], self._queued(), out=queued_waiting_times)
+        return float(queued_waiting_times.sum())
+
+    # Number of vehicles in queue
+    def queue(self):
+        return int(np.count_nonzero(self._queued()))
+
+    # Number of cars, average speed, cumulated waiting time and number of cars queued per cell going to the tls
+    def cell_state(self):
+        number_of_cells = self.geometry.number_of_cells
+        bins = self._bins[:self.size]
+        weights = self._weights[:self.size]
+
+        # number of cars per cell going to the tls
+        cars_per_cell = np.bincount(bins, minlength=number_of_cells + 1)[:number_of_cells].astype(np.float64)
+        # average speed per cell / ignore divide by zero warnings
+        np.copyto(weights, self.speeds[:self.size])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            average_speed_per_cell = np.nan_to_num(np.divide(np.bincount(bins, weights=weights, minlength=number_of_cells + 1)[:number_of_cells], cars_per_cell))
+        # cumulated waiting time per cell
+        queued = self._queued()
+        np.multiply(self.waiting_times[:self.size], queued, out=weights)
+        cumulated_waiting_time_per_cell = np.bincount(bins, weights=weights, minlength=number_of_cells + 1)[:number_of_cells]
+        # number of cars queued per cell
+        np.copyto(weights, queued)
+        queue_per_cell = np.bincount(bins, weights=weights, minlength=number_of_cells + 1)[:number_of_cells]
+
+        return cars_per_cell, average_speed_per_cell, cumulated_waiting_time_per_cell, queue_per_cell
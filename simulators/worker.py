@@ -0,0 +1,156 @@
+import ctypes
+import multiprocessing as mp
+import numpy as np
+import requests
+from generate_routefile import generate_routefile
+
+# Commands sent by the trainer to every worker
+STOP = 0
+RESET = 1
+DECIDE = 2
+
+
+# Shared memory block seen as a NumPy array by the trainer and every worker, nothing is pickled once the workers run
+def shared_array(shape, ctype=ctypes.c_double):
+    return mp.RawArray(ctype, int(np.prod(shape))), shape
+
+
+def as_array(shared, dtype=np.float64):
+    raw_array, shape = shared
+    return np.frombuffer(raw_array, dtype=dtype).reshape(shape)
+
+
+# Long lived process running every episode of one mode.
+# SUMO is started with the first episode and reloaded (Simulator.reset) with the route file of each following one.
+# The trainer and the worker take turns around the barrier: the trainer writes the command (and the actions), the worker
+# runs it and writes its decision states, one per junction asking for an action (and the episode stats at the end).
+def simulator_worker(index, create_simulator, mode, max_steps, barrier, shared):
+    commands = as_array(shared['commands'], np.int64)
+    arguments = as_array(shared['arguments'], np.int64)
+    actions = as_array(shared['actions'], np.int64)
+    steps = as_array(shared['steps'], np.int64)
+    states = as_array(shared['states'])
+    history_lengths = as_array(shared['history_lengths'], np.int64)
+    stats = as_array(shared['stats'])
+    counts = as_array(shared['counts'], np.int64)
+    skips = as_array(shared['skips'], np.int64)
+
+    sim = None
+    while True:
+        barrier.wait()
+        command = commands[index]
+        if command == STOP:
+            break
+        try:
+            if command == RESET:
+                # Generate routefile dynamically, the episode number is the seed
+                generate_routefile(max_steps, arguments[index], mode)
+                if sim is None:
+                    sim = create_simulator(mode, max_steps)
+                else:
+                    sim.reset()
+                steps[index] = sim.start_step
+            elif command == DECIDE and steps[index] < max_steps:
+                steps[index] = sim.do_decision(int(steps[index]), actions[index, :counts[index]].tolist())
+
+            if steps[index] < max_steps:
+                decision_states = sim.decision_states()
+                counts[index] = len(decision_states)
+                for junction, state in enumerate(decision_states):
+                    history = np.atleast_2d(state)
+                    history_lengths[index, junction] = len(history)
+                    states[index, junction, :len(history)] = history
+            else:
+                stats[index] = sim.stats()
+                skips[index] = sim.idle_decisions, sim.idle_transitions
+        except Exception:
+            # Break the barrier instead of leaving the trainer and the other workers waiting forever
+            barrier.abort()
+            raise
+        barrier.wait()
+
+    if sim is not None:
+        sim.stop()
+
+
+class SimulatorPool:
+
+    # One simulator_worker per mode, kept for the whole training run, driven in lockstep from one decision tick to the next:
+    # the decision states of all the workers are read from shared memory and go to the agent in a single /act_batch call.
+    # create_simulator(mode, max_steps) builds an event stepping Simulator inside the worker process.
+    # history_size: number of states the agent decides on (4 for the LSTM agent)
+    # n_junctions: number of traffic lights driven by each simulator (its tls_ids), at most one decision state each per tick
+    def __init__(self, create_simulator, modes, max_steps, state_size, history_size=1, n_junctions=1, act_url='http://127.0.0.1:5000/act_batch'):
+        self.modes = list(modes)
+        self.max_steps = max_steps
+        self.act_url = act_url
+        n = len(self.modes)
+        shared = {
+            'commands': shared_array((n, ), ctypes.c_int64),
+            'arguments': shared_array((n, ), ctypes.c_int64),
+            'actions': shared_array((n, n_junctions), ctypes.c_int64),
+            'steps': shared_array((n, ), ctypes.c_int64),
+            'states': shared_array((n, n_junctions, history_size, state_size)),
+            'history_lengths': shared_array((n, n_junctions), ctypes.c_int64),
+            # cumulative reward, average waiting time, average intersection queue, throughput, seconds skipped once drained
+            'stats': shared_array((n, 5)),
+            # Number of decision states of each worker: the empty junctions choose their action themselves
+            'counts': shared_array((n, ), ctypes.c_int64),
+            # act calls and transitions skipped on an empty junction during the last episode
+            'skips': shared_array((n, 2), ctypes.c_int64),
+        }
+        self.commands = as_array(shared['commands'], np.int64)
+        self.arguments = as_array(shared['arguments'], np.int64)
+        self.actions = as_array(shared['actions'], np.int64)
+        self.steps = as_array(shared['steps'], np.int64)
+        self.states = as_array(shared['states'])
+        self.history_lengths = as_array(shared['history_lengths'], np.int64)
+        self.stats = as_array(shared['stats'])
+        self.counts = as_array(shared['counts'], np.int64)
+        self.skips = as_array(shared['skips'], np.int64)
+        # Number of /act_batch calls and of actions they returned in the last episode
+        self.ticks = 0
+        self.decisions = 0
+
+        self.barrier = mp.Barrier(n + 1)
+        self.processes = []
+        for index, mode in enumerate(self.modes):
+            p = mp.Process(target=simulator_worker, args=(index, create_simulator, mode, max_steps, self.barrier, shared))
+            self.processes.append(p)
+            p.start()
+
+    def _command(self, command):
+        self.commands[:] = command
+        # The workers run the command between the two waits
+        self.barrier.wait()
+        self.barrier.wait()
+
+    # One action per decision state, in order
+    def act(self, states):
+        return requests.post(self.act_url, json={'states': [state.tolist() for state in states]}).json()['actions']
+
+    # Run the episode in every mode, return {mode: stats}
+    def run_episode(self, episode):
+        self.arguments[:] = episode
+        self._command(RESET)
+        self.ticks = 0
+        self.decisions = 0
+        while True:
+            waiting = np.flatnonzero(self.steps < self.max_steps)
+            if len(waiting) == 0:
+                break
+            deciding = [(i, junction) for i in waiting.tolist() for junction in range(self.counts[i])]
+            if deciding:
+                actions = self.act([self.states[i, junction, :self.history_lengths[i, junction]] for i, junction in deciding])
+                for (i, junction), action in zip(deciding, actions):
+                    self.actions[i, junction] = action
+            self._command(DECIDE)
+            self.ticks += 1
+            self.decisions += len(deciding)
+        return {mode: tuple(self.stats[index].tolist()) for index, mode in enumerate(self.modes)}
+
+    def close(self):
+        self.commands[:] = STOP
+        self.barrier.wait()
+        for p in self.processes:
+            p.join()
@@ -16,6 +16,7 @@ def test_naive(sumocfg, gui, state_size, max_steps, green_phase_duration):
     sim = Simulator_Naive('naive', sumocfg, max_steps, green_phase_duration, gui)
     # Run simulator
     cumulative_reward, avg_waiting_time, avg_intersection_queue, throughput = sim.run(max_steps)
+    print('Skipped (network drained):', sim.skipped_steps, 'seconds')
     del sim
     return avg_waiting_time, avg_intersection_queue, throughput
 
@@ -28,6 +29,8 @@ def test_ffno(sumocfg, gui, state_size, max_steps):
     sim = Simulator_FFNO('ffno', sumocfg, state_size, max_steps, gui)
     # Run simulator
     cumulative_reward, avg_waiting_time, avg_intersection_queue, throughput = sim.run(max_steps)
+    print('Skipped (network drained):', sim.skipped_steps, 'seconds')
+    print('Idle junction:', sim.idle_decisions, 'act calls skipped')
     del sim
     return avg_waiting_time, avg_intersection_queue, throughput
 
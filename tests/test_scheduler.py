@@ -0,0 +1,56 @@
+import time
+import multiprocessing as mp
+import pytest
+import simulators.scheduler as scheduler
+from simulators.scheduler import ScenarioScheduler, WorkerError
+
+# The workers inherit the patched generate_routefile from the test process
+pytestmark = pytest.mark.skipif(mp.get_start_method() != 'fork', reason='needs fork started workers')
+
+
+class FakeSimulator:
+
+    def __init__(self, mode):
+        self.mode = mode
+
+    def reset(self):
+        pass
+
+    def run_episode(self, max_steps):
+        time.sleep(0.05)
+        return (0, 0, 0, 0, 0)
+
+    def stop(self):
+        pass
+
+
+# 'high' tasks fail in the worker
+def create_simulator(mode, max_steps, route_file):
+    if mode == 'high':
+        raise RuntimeError('no simulator for ' + mode)
+    return FakeSimulator(mode)
+
+
+@pytest.fixture
+def sweep(monkeypatch):
+    monkeypatch.setattr(scheduler, 'generate_routefile', lambda *args: None)
+    sweep = ScenarioScheduler(create_simulator, 10, n_workers=2)
+    yield sweep
+    sweep.close()
+
+
+def test_run(sweep):
+    tasks = [('low', seed) for seed in range(6)]
+    results = sweep.run(tasks)
+    assert sorted((mode, seed) for mode, seed, _, _, _ in results) == tasks
+
+
+def test_run_after_failure(sweep):
+    with pytest.raises(WorkerError, match='no simulator for high'):
+        sweep.run([('high', 0)] + [('low', seed) for seed in range(10)])
+
+    # Nothing left over from the failed run: only the results of the new tasks
+    tasks = [('low', seed) for seed in range(100, 104)]
+    results = sweep.run(tasks)
+    assert sorted((mode, seed) for mode, seed, _, _, _ in results) == tasks
+    assert sweep.results.empty()
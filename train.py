@@ -4,28 +4,18 @@ import sys
 import time
 import pickle
 import requests
-from generate_routefile import generate_routefile
 from plot_stats import plot_stats
 from feed_forward_dropout.simulator_train import Simulator
+from simulators.worker import SimulatorPool
 
-import multiprocessing as mp
 
-
-def create_simulator(state_size, max_steps, seed, mode):
-    # Generate routefile dynamically
-    generate_routefile(max_steps, seed, mode)
-    # Create Simulator
-    sim = Simulator(label=mode, sumocfg='environments/' + mode + '/tlcs_config_train.sumocfg', state_size=STATE_SIZE, max_steps=max_steps)
+# Built once per mode inside its worker process, the following episodes reload it with their route file.
+# The pool advances SUMO straight from one decision to the next.
+def create_simulator(mode, max_steps):
+    sim = Simulator(label=mode, sumocfg='environments/' + mode + '/tlcs_config_train.sumocfg', state_size=STATE_SIZE, max_steps=max_steps, stepping='event')
     return sim
 
 
-def simulate(mode, state_size, max_steps, episode, return_dict):
-    sim = create_simulator(state_size, max_steps, episode, mode)
-    for step in range(0, max_steps):
-        sim.do_step(step)
-    return_dict[mode] = sim.stop()
-
-
 # main entry point
 if __name__ == "__main__":
     EPISODES = 100
@@ -43,6 +33,10 @@ if __name__ == "__main__":
     THROUGHPUT_STORE = []
     AVG_INTERSECTION_QUEUE_STORE = []
 
+    # One SUMO process per mode for the whole run, states, actions and stats exchanged through shared memory
+    # workers = SimulatorPool(create_simulator, ['low'], MAX_STEPS, STATE_SIZE)
+    workers = SimulatorPool(create_simulator, ['low', 'high', 'north-south', 'east-west'], MAX_STEPS, STATE_SIZE)
+
     for episode in range(len(REWARD_STORE), EPISODES):
         print('\n')
         print("----- Starting episode: ", episode)
@@ -52,24 +46,15 @@ if __name__ == "__main__":
 
         start_time = time.time()
 
-        manager = mp.Manager()
-        return_dict = manager.dict()
-        jobs = []
-
-        # for mode in ['low']:
-        for mode in ['low', 'high', 'north-south', 'east-west']:
-            p = mp.Process(target=simulate, args=(mode, STATE_SIZE, MAX_STEPS, episode, return_dict))
-            jobs.append(p)
-            p.start()
-
-        for proc in jobs:
-            proc.join()
+        return_dict = workers.run_episode(episode)
 
         for key in ['low', 'high', 'north-south', 'east-west']:
             REWARD_STORE.append(return_dict[key][0])
             AVG_WAIT_STORE.append(return_dict[key][1])
             AVG_INTERSECTION_QUEUE_STORE.append(return_dict[key][2])
             THROUGHPUT_STORE.append(return_dict[key][3])
+        print("----- Skipped (network drained): ", {key: int(return_dict[key][4]) for key in return_dict}, " seconds")
+        print("----- Idle junction (act calls, transitions skipped): ", {mode: tuple(workers.skips[index].tolist()) for index, mode in enumerate(workers.modes)})
 
         # Experience
         requests.post('http://127.0.0.1:5000/replay')
@@ -89,4 +74,5 @@ if __name__ == "__main__":
                 pickle.dump(AVG_INTERSECTION_QUEUE_STORE, f)
             plot_stats(NAME, REWARD_STORE, AVG_WAIT_STORE, THROUGHPUT_STORE, AVG_INTERSECTION_QUEUE_STORE)
 
+    workers.close()
     sys.stdout.flush()
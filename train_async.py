@@ -0,0 +1,117 @@
+#!/usr/bin/python3
+
+import sys
+import time
+import pickle
+from generate_routefile import generate_routefile
+from plot_stats import plot_stats
+from feed_forward_dropout.simulator_train import Simulator
+from feed_forward_dropout.DQNAgent import DQNAgent
+from simulators.async_runner import AsyncRunner
+
+
+# Route file of one scenario: several scenarios of the same mode run at the same time
+def scenario_route_file(mode, index):
+    return 'environments/' + mode + '/tlcs_train_' + str(index) + '.rou.xml'
+
+
+# main entry point
+if __name__ == "__main__":
+    EPISODES = 100
+    MAX_STEPS = 3600
+    # Scenarios run at the same time from this process, 4 per mode
+    SCENARIOS = [(mode, index) for index in range(4) for mode in ['low', 'high', 'north-south', 'east-west']]
+
+    # Agent hyperparameters (same as feed_forward_dropout/web_agent_train.py, the agent lives in this process)
+    STATE_SIZE = 320
+    ACTION_SIZE = 4
+    MEMORY_SIZE = 1024
+    GAMMA = 0.95
+    EPSILON = 1.0
+    EPSILON_DECAY_RATE = 0.99999
+    EPSILON_MIN = 0.01
+    LEARNING_RATE = 0.0002
+    SAMPLE_SIZE = 256
+    BATCH_SIZE = 64
+    # Gradient steps per episode, each one on a fresh minibatch: as many updates as the previous 100 fits of 200 epochs
+    GRADIENT_STEPS = 20000
+    NAME = 'Feed-Forward Dropout DQNAgent'
+
+    agent = DQNAgent(
+        state_size=STATE_SIZE,
+        action_size=ACTION_SIZE,
+        memory_size=MEMORY_SIZE,
+        gamma=GAMMA,
+        epsilon=EPSILON,
+        epsilon_decay_rate=EPSILON_DECAY_RATE,
+        epsilon_min=EPSILON_MIN,
+        learning_rate=LEARNING_RATE,
+        sample_size=SAMPLE_SIZE,
+        batch_size=BATCH_SIZE,
+        name='ffdo_DQNAgent'
+    )
+
+    # Stats
+    REWARD_STORE = []
+    AVG_WAIT_STORE = []
+    THROUGHPUT_STORE = []
+    AVG_INTERSECTION_QUEUE_STORE = []
+
+    runner = None
+
+    for episode in range(len(REWARD_STORE), EPISODES):
+        print('\n')
+        print("----- Starting episode: ", episode)
+
+        agent.epsilon = EPSILON - (episode / EPISODES)
+
+        start_time = time.time()
+
+        # Generate routefiles dynamically, one seed per scenario
+        for scenario, (mode, index) in enumerate(SCENARIOS):
+            generate_routefile(MAX_STEPS, episode * len(SCENARIOS) + scenario, mode, scenario_route_file(mode, index))
+        if runner is None:
+            # One TraCI connection per scenario, libsumo runs a single simulation per process
+            simulators = [Simulator(label=mode + '-' + str(index), sumocfg='environments/' + mode + '/tlcs_config_train.sumocfg', state_size=STATE_SIZE, max_steps=MAX_STEPS, backend='traci', stepping='event', route_file=scenario_route_file(mode, index)) for mode, index in SCENARIOS]
+            runner = AsyncRunner(simulators, agent)
+        else:
+            runner.reset()
+
+        results = runner.run_episode(MAX_STEPS)
+        print("----- Decisions: ", runner.batcher.decisions, " in ", runner.batcher.calls, " act calls")
+
+        for result in results:
+            REWARD_STORE.append(result[0])
+            AVG_WAIT_STORE.append(result[1])
+            AVG_INTERSECTION_QUEUE_STORE.append(result[2])
+            THROUGHPUT_STORE.append(result[3])
+        print("----- Skipped (network drained): ", sum(result[4] for result in results), " seconds")
+        idle_skips = {}
+        for (mode, index), sim in zip(SCENARIOS, runner.simulators):
+            decisions, transitions = idle_skips.get(mode, (0, 0))
+            idle_skips[mode] = (decisions + sim.idle_decisions, transitions + sim.idle_transitions)
+        print("----- Idle junction (act calls, transitions skipped): ", idle_skips)
+
+        # Experience
+        if len(agent.memory) >= SAMPLE_SIZE:
+            loss, acc, updates_per_second = agent.train(GRADIENT_STEPS)
+            print('--->', 'Loss:', loss, 'Updates/s:', round(updates_per_second, 1))
+
+        elapsed_time = round(time.time() - start_time, 2)
+        print("----- Elapsed time: ", elapsed_time, " seconds -----")
+
+        if (episode + 1) % 10 == 0:
+            agent.save()
+            with open('history/REWARD_STORE.out', 'wb') as f:
+                pickle.dump(REWARD_STORE, f)
+            with open('history/AVG_WAIT_STORE.out', 'wb') as f:
+                pickle.dump(AVG_WAIT_STORE, f)
+            with open('history/THROUGHPUT_STORE.out', 'wb') as f:
+                pickle.dump(THROUGHPUT_STORE, f)
+            with open('history/AVG_INTERSECTION_QUEUE_STORE.out', 'wb') as f:
+                pickle.dump(AVG_INTERSECTION_QUEUE_STORE, f)
+            plot_stats(NAME, REWARD_STORE, AVG_WAIT_STORE, THROUGHPUT_STORE, AVG_INTERSECTION_QUEUE_STORE)
+
+    if runner is not None:
+        runner.stop()
+    sys.stdout.flush()
@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+
+import sys
+import time
+import pickle
+import requests
+from plot_stats import plot_stats
+from feed_forward_dropout.simulator_train import Simulator
+from simulators.scheduler import ScenarioScheduler
+
+
+# Built inside a scheduler worker the first time it runs the mode, the following tasks reload it with their route file.
+# A worker keeps one simulator per mode it has run: libsumo runs a single simulation per process, so this needs TraCI.
+def create_simulator(mode, max_steps, route_file):
+    sim = Simulator(label=mode, sumocfg='environments/' + mode + '/tlcs_config_train.sumocfg', state_size=STATE_SIZE, max_steps=max_steps, stepping='event', route_file=route_file, backend='traci')
+    return sim
+
+
+# main entry point
+if __name__ == "__main__":
+    EPISODES = 100
+    MAX_STEPS = 3600
+    MODES = ['low', 'high', 'north-south', 'east-west']
+    # (mode, seed) tasks per mode and episode
+    SEEDS_PER_MODE = 8
+
+    # Agent hyperparameters
+    STATE_SIZE = 320
+    EPSILON = 1.0
+    NAME = 'Feed-Forward Dropout DQNAgent'
+
+    # Stats
+    REWARD_STORE = []
+    AVG_WAIT_STORE = []
+    THROUGHPUT_STORE = []
+    AVG_INTERSECTION_QUEUE_STORE = []
+
+    # One worker per core for the whole run
+    scheduler = ScenarioScheduler(create_simulator, MAX_STEPS)
+
+    for episode in range(len(REWARD_STORE), EPISODES):
+        print('\n')
+        print("----- Starting episode: ", episode)
+
+        epsilon = EPSILON - (episode / EPISODES)
+        requests.post('http://127.0.0.1:5000/update_epsilon', json={'epsilon': epsilon})
+
+        start_time = time.time()
+
+        tasks = [(mode, episode * SEEDS_PER_MODE + seed) for seed in range(SEEDS_PER_MODE) for mode in MODES]
+        for mode, seed, stats, task_time, worker in scheduler.run(tasks):
+            print("{:12} seed {:5} worker {:3} {:7.2f} seconds, {:5} simulated seconds skipped".format(mode, seed, worker, task_time, stats[4]))
+            REWARD_STORE.append(stats[0])
+            AVG_WAIT_STORE.append(stats[1])
+            AVG_INTERSECTION_QUEUE_STORE.append(stats[2])
+            THROUGHPUT_STORE.append(stats[3])
+
+        # Experience
+        requests.post('http://127.0.0.1:5000/replay')
+
+        elapsed_time = round(time.time() - start_time, 2)
+        print("----- Elapsed time: ", elapsed_time, " seconds -----")
+
+        if (episode + 1) % 10 == 0:
+            requests.post('http://127.0.0.1:5000/save')
+            with open('history/REWARD_STORE.out', 'wb') as f:
+                pickle.dump(REWARD_STORE, f)
+            with open('history/AVG_WAIT_STORE.out', 'wb') as f:
+                pickle.dump(AVG_WAIT_STORE, f)
+            with open('history/THROUGHPUT_STORE.out', 'wb') as f:
+                pickle.dump(THROUGHPUT_STORE, f)
+            with open('history/AVG_INTERSECTION_QUEUE_STORE.out', 'wb') as f:
+                pickle.dump(AVG_INTERSECTION_QUEUE_STORE, f)
+            plot_stats(NAME, REWARD_STORE, AVG_WAIT_STORE, THROUGHPUT_STORE, AVG_INTERSECTION_QUEUE_STORE)
+
+    scheduler.close()
+    sys.stdout.flush()
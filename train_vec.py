@@ -0,0 +1,82 @@
+#!/usr/bin/python3
+
+import sys
+import time
+import pickle
+import requests
+from generate_routefile import generate_routefile
+from plot_stats import plot_stats
+from feed_forward_dropout.simulator_train import Simulator
+from simulators.vec_simulator import VecSimulator
+
+
+# main entry point
+if __name__ == "__main__":
+    EPISODES = 100
+    MAX_STEPS = 3600
+    MODES = ['low', 'high', 'north-south', 'east-west']
+
+    # Agent hyperparameters
+    STATE_SIZE = 320
+    EPSILON = 1.0
+    NAME = 'Feed-Forward Dropout DQNAgent'
+
+    # Stats
+    REWARD_STORE = []
+    AVG_WAIT_STORE = []
+    THROUGHPUT_STORE = []
+    AVG_INTERSECTION_QUEUE_STORE = []
+
+    # All the modes in this process, one batched act per decision tick
+    vec_simulator = None
+
+    for episode in range(len(REWARD_STORE), EPISODES):
+        print('\n')
+        print("----- Starting episode: ", episode)
+
+        epsilon = EPSILON - (episode / EPISODES)
+        requests.post('http://127.0.0.1:5000/update_epsilon', json={'epsilon': epsilon})
+
+        start_time = time.time()
+
+        # Generate routefiles dynamically
+        for mode in MODES:
+            generate_routefile(MAX_STEPS, episode, mode)
+        if vec_simulator is None:
+            # Several simulations in this process: libsumo runs a single one per process, so this needs TraCI
+            vec_simulator = VecSimulator([Simulator(label=mode, sumocfg='environments/' + mode + '/tlcs_config_train.sumocfg', state_size=STATE_SIZE, max_steps=MAX_STEPS, stepping='event', backend='traci') for mode in MODES])
+        else:
+            vec_simulator.reset()
+
+        results = vec_simulator.run_episode(MAX_STEPS)
+        print("----- Decisions: ", vec_simulator.decisions, " in ", vec_simulator.ticks, " act calls")
+
+        for result in results:
+            REWARD_STORE.append(result[0])
+            AVG_WAIT_STORE.append(result[1])
+            AVG_INTERSECTION_QUEUE_STORE.append(result[2])
+            THROUGHPUT_STORE.append(result[3])
+        print("----- Skipped (network drained): ", sum(result[4] for result in results), " seconds")
+        print("----- Idle junction (act calls, transitions skipped): ", {sim.label: (sim.idle_decisions, sim.idle_transitions) for sim in vec_simulator.simulators})
+
+        # Experience
+        requests.post('http://127.0.0.1:5000/replay')
+
+        elapsed_time = round(time.time() - start_time, 2)
+        print("----- Elapsed time: ", elapsed_time, " seconds -----")
+
+        if (episode + 1) % 10 == 0:
+            requests.post('http://127.0.0.1:5000/save')
+            with open('history/REWARD_STORE.out', 'wb') as f:
+                pickle.dump(REWARD_STORE, f)
+            with open('history/AVG_WAIT_STORE.out', 'wb') as f:
+                pickle.dump(AVG_WAIT_STORE, f)
+            with open('history/THROUGHPUT_STORE.out', 'wb') as f:
+                pickle.dump(THROUGHPUT_STORE, f)
+            with open('history/AVG_INTERSECTION_QUEUE_STORE.out', 'wb') as f:
+                pickle.dump(AVG_INTERSECTION_QUEUE_STORE, f)
+            plot_stats(NAME, REWARD_STORE, AVG_WAIT_STORE, THROUGHPUT_STORE, AVG_INTERSECTION_QUEUE_STORE)
+
+    if vec_simulator is not None:
+        vec_simulator.stop()
+    sys.stdout.flush()